@@ -0,0 +1,66 @@
+from engine import get_engine
+from lazy import lazy_import
+from schemas import enforce_schema
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Dimensions and measures of the video-game sales cube
+CUBE_KEYS = ['Year', 'Genre', 'Platform']
+SALES_COLUMNS = ['Global_Sales', 'NA_Sales', 'EU_Sales', 'JP_Sales', 'Other_Sales']
+
+
+# Sum every sales column by Year, Genre and Platform. Rows with a missing key
+# are kept as their own cell so per-platform totals still include them.
+def build_cube(frame):
+    frame = frame.reindex(columns=CUBE_KEYS + SALES_COLUMNS)
+    cube = get_engine().groupby_sum(frame, CUBE_KEYS, SALES_COLUMNS, dropna=False).reset_index()
+
+    # Totals are kept in double precision even when rows are stored narrower
+    return cube.astype({column: 'float64' for column in SALES_COLUMNS})
+
+
+# Cube of one stored partition in the given schema, read through a memory
+# map; cheap to send to another process, which only receives the file entry.
+# Only the cube's columns are read.
+def partition_cube(dataset, schema, entry):
+    columns = {name: schema[name] for name in CUBE_KEYS + SALES_COLUMNS if name in schema}
+    return build_cube(enforce_schema(dataset.read_partition(entry, list(columns)), columns))
+
+
+# Add up cubes built separately, e.g. one per partition. The cubes are small,
+# so this stays a plain groupby.
+def merge_cubes(cubes):
+    cubes = [cube for cube in cubes if cube is not None]
+    filled = [cube for cube in cubes if not cube.empty]
+
+    if len(filled) <= 1:
+        return (filled or cubes or [None])[-1]
+
+    merged = pd.concat(filled, ignore_index=True)
+    return merged.groupby(CUBE_KEYS, dropna=False, observed=True)[SALES_COLUMNS].sum().reset_index()
+
+
+# Fold newly ingested rows into an existing cube without touching old rows
+def merge_cube(cube, frame):
+    return merge_cubes([cube, build_cube(frame)])
+
+
+# Global sales per genre as year-sorted arrays, so a "Year <= cutoff" query
+# is a slice found with a binary search instead of a filter and a groupby
+def build_genre_index(cube):
+    by_year = cube.groupby(['Genre', 'Year'], observed=True)['Global_Sales'].sum().round(2).reset_index()
+
+    index = {}
+    for genre, rows in by_year.groupby('Genre', observed=True):
+        rows = rows.sort_values('Year')
+        index[genre] = (rows['Year'].to_numpy(dtype='int64'), rows['Global_Sales'].to_numpy())
+
+    return index
+
+
+# Years and sales of a genre up to and including the cutoff year
+def genre_series_until(index, genre, year):
+    years, sales = index.get(genre, (np.empty(0), np.empty(0)))
+    end = np.searchsorted(years, year, side='right')
+    return years[:end], sales[:end]
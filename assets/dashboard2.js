@@ -0,0 +1,90 @@
+// Dashboard 2 drawn in the browser from the payload in 'dashboard2-store'
+// (see dashboard2_payload in demo.py): changing a dropdown only filters
+// counts that are already here, without a request to the server.
+
+const EMPTY_FIGURE = {data: [], layout: {}};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard2: {
+        pie_chart: function (payload, selectedProductLine) {
+            if (!payload) {
+                return window.dash_clientside.no_update;
+            }
+
+            const counts = payload.gender[selectedProductLine];
+            if (!counts) {
+                return EMPTY_FIGURE;
+            }
+
+            const genders = Object.keys(counts);
+            const total = genders.reduce((sum, gender) => sum + counts[gender], 0);
+
+            return {
+                data: [{
+                    type: 'pie',
+                    labels: genders,
+                    values: genders.map((gender) => counts[gender] / total * 100),
+                    marker: {colors: ['#DBADD0', '#778BDB']},
+                }],
+                layout: {
+                    title: {text: `Distribution of Gender in ${selectedProductLine}`},
+                    legend: {tracegroupgap: 0},
+                },
+            };
+        },
+
+        payment_count: function (payload, selectedCity) {
+            if (!payload) {
+                return window.dash_clientside.no_update;
+            }
+
+            const counts = payload.payment[selectedCity];
+            if (!counts) {
+                return EMPTY_FIGURE;
+            }
+
+            // Most used payment methods first, like value_counts
+            const methods = Object.keys(counts).sort((a, b) => counts[b] - counts[a]);
+
+            return {
+                data: [{
+                    type: 'bar',
+                    x: methods,
+                    y: methods.map((method) => counts[method]),
+                }],
+                layout: {
+                    title: {text: `Payment Method Distribution in ${selectedCity}`},
+                    xaxis: {title: {text: 'Payment Method'}},
+                    yaxis: {title: {text: 'Count'}},
+                    barmode: 'relative',
+                },
+            };
+        },
+
+        gross_margin_bar: function (payload, selectedProductLine, selectedCity) {
+            if (!payload) {
+                return window.dash_clientside.no_update;
+            }
+
+            const series = (payload.gross_margin[selectedProductLine] || {})[selectedCity];
+            if (!series) {
+                return EMPTY_FIGURE;
+            }
+
+            return {
+                data: [{
+                    type: 'bar',
+                    x: series.x,
+                    y: series.y,
+                }],
+                layout: {
+                    title: {text: `Gross Margin for ${selectedProductLine} in ${selectedCity}`},
+                    xaxis: {title: {text: 'Date'}},
+                    yaxis: {title: {text: 'Gross Margin'}},
+                    barmode: 'relative',
+                    uirevision: `${payload.key}-${selectedProductLine}-${selectedCity}`,
+                },
+            };
+        },
+    },
+});
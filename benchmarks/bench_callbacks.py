@@ -0,0 +1,301 @@
+# Latency (p50/p99), peak memory and payload size of the callbacks of both
+# dashboards on synthetic datasets of growing size (see generators.py), each
+# called directly and as a request through the Flask test client. Every
+# module and size runs in a fresh interpreter with its own data directories,
+# and the result cache is bypassed so each call does its full work, as on
+# the first view of new data.
+#
+# Results are compared with a baseline stored by an earlier run with --save
+# (benchmarks/baseline.json by default, recorded on the machine the
+# comparisons run on); a p50 slower than the baseline by more than
+# --tolerance, or a payload that grew by as much, is reported as a
+# regression and makes the run exit with status 1.
+#
+#   python -m benchmarks.bench_callbacks [--rows 1000 10000 ...] [--repeat 20] [--save]
+#
+# Peak memory is what Python and NumPy allocate during one call (tracemalloc);
+# memory-mapped Feather columns are not counted.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import memo
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE = os.path.join(REPO_DIR, 'benchmarks', 'baseline.json')
+
+MODULES = ['demo', 'prueba_emiliano']
+
+# Up to 10_000_000 can be asked for with --rows
+DEFAULT_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+
+# Upload cases build the whole base64 upload in memory, so larger datasets
+# skip them
+MAX_UPLOAD_ROWS = 1_000_000
+
+# Upload cases write a dataset per call and are repeated at most this often
+UPLOAD_REPEAT = 3
+
+# Measuring one case stops after this many seconds, with at least 3 calls
+CASE_SECONDS = 30
+
+
+# Result cache that never hits, so memoized callbacks always compute
+class NoCache:
+    def get(self, key):
+        return memo._MISSING
+
+    def set(self, key, value):
+        pass
+
+
+# Body of a /_dash-update-component request, as dash-renderer sends it
+def callback_request(outputs, inputs, state=(), changed=None):
+    spec = [{'id': id, 'property': prop} for id, prop in outputs]
+    if len(outputs) == 1:
+        output, spec = f'{outputs[0][0]}.{outputs[0][1]}', spec[0]
+    else:
+        output = '..' + '...'.join(f'{id}.{prop}' for id, prop in outputs) + '..'
+    return {
+        'output': output,
+        'outputs': spec,
+        'inputs': [{'id': id, 'property': prop, 'value': value} for id, prop, value in inputs],
+        'changedPropIds': changed or [f'{inputs[0][0]}.{inputs[0][1]}'],
+        'state': [{'id': id, 'property': prop, 'value': value} for id, prop, value in state],
+    }
+
+
+# Cases of demo.py: (name, direct call, request body or None, is an upload)
+def demo_cases(rows, rng, directory):
+    from benchmarks.generators import PRODUCT_LINES, supermarket, upload_contents
+    from datastore import DatasetStore
+    from schemas import SUPERMARKET_SALES, enforce_schema
+
+    frame = supermarket(rows, rng)
+    key = DatasetStore().put('bench', enforce_schema(frame, SUPERMARKET_SALES))
+
+    import demo
+    from ingest import store_upload, upload_digest, upload_to_file
+
+    product_line, city = PRODUCT_LINES[0], 'Yangon'
+    data = ('data-store', 'data', key)
+    cases = [
+        ('update_dropdown_options', lambda: demo.update_dropdown_options(key, product_line, city, product_line, city),
+         callback_request([(id, prop) for id in ['product-line-dropdown', 'city-dropdown',
+                                                 'product-line-dropdown-2', 'city-dropdown-2']
+                           for prop in ['options', 'value']],
+                          [data], [('product-line-dropdown', 'value', product_line), ('city-dropdown', 'value', city),
+                                   ('product-line-dropdown-2', 'value', product_line), ('city-dropdown-2', 'value', city)])),
+        ('line_chart_figure', lambda: demo.line_chart_figure(key, product_line, None),
+         callback_request([('line-chart', 'figure')],
+                          [data, ('product-line-dropdown', 'value', product_line), ('line-chart', 'relayoutData', None)])),
+        ('map_chart_figure', lambda: demo.map_chart_figure(key, product_line, None),
+         callback_request([('map-chart', 'figure')],
+                          [data, ('product-line-dropdown', 'value', product_line), ('map-chart', 'relayoutData', None)])),
+        ('product_line_bar_figure', lambda: demo.product_line_bar_figure(key, city),
+         callback_request([('bar-chart-product-line', 'figure')], [data, ('city-dropdown', 'value', city)])),
+        ('update_city_bar', lambda: demo.update_city_bar(key),
+         callback_request([('bar-chart-city', 'figure')], [data])),
+        ('dashboard2_payload', lambda: demo.dashboard2_payload(key),
+         callback_request([('dashboard2-store', 'data')], [data]) if demo.clientside_dashboard2 else None),
+        ('update_pie_chart', lambda: demo.update_pie_chart(key, product_line), None),
+        ('update_payment_count', lambda: demo.update_payment_count(key, city), None),
+        ('gross_margin_figure', lambda: demo.gross_margin_figure(key, product_line, city, None), None),
+    ]
+
+    if rows <= MAX_UPLOAD_ROWS:
+        contents = upload_contents(frame)
+        target = lambda: tempfile.mkdtemp(dir=directory)
+        cases.append(('store_upload', lambda: store_upload(upload_to_file(contents), demo.upload_columns, target(),
+                                                           upload_digest(contents), 'Date'), None, True))
+
+    return [case if len(case) == 4 else case + (False,) for case in cases]
+
+
+# Cases of prueba_emiliano.py, on a history of one partition in ./data
+def prueba_cases(rows, rng, directory):
+    from benchmarks.generators import GENRES, upload_contents, video_games
+    from partitions import PartitionedDataset
+    from schemas import VIDEO_GAME_KEY, VIDEO_GAME_SALES, enforce_schema
+
+    frame = video_games(rows, rng)
+    PartitionedDataset('data', VIDEO_GAME_KEY).append(enforce_schema(frame, VIDEO_GAME_SALES))
+
+    import prueba_emiliano as prueba
+    from ingest import append_upload, upload_digest, upload_to_file
+
+    year, sales, platform = 2000, 'Global_Sales', 'PS2'
+    version = ('data-version', 'data', str(prueba.data_version()))
+    cases = [
+        ('render_content', lambda: prueba.render_content('tab4'),
+         callback_request([('tabs-content', 'children')], [('tabs', 'value', 'tab4')])),
+        ('update_gauge_chart', lambda: prueba.gauge_figure(platform),
+         callback_request([('sales-graph', 'figure')], [('platform-dropdown', 'value', platform), version])),
+        ('bar_chart_figure', lambda: prueba.bar_chart_figure(year, sales),
+         callback_request([('bar-chart', 'figure')], [('year-slider', 'value', year), ('sales-dropdown', 'value', sales), version],
+                          changed=['year-slider.value', 'sales-dropdown.value'])),
+        ('update_time_series_chart', lambda: prueba.time_series_figure(year, GENRES),
+         callback_request([('time-series-chart', 'figure')],
+                          [('year-slider-ts', 'value', year), ('genre-checklist-ts', 'value', GENRES), version])),
+        # The line chart poll_upload draws once an upload is stored
+        ('line_chart_figure', lambda: prueba.line_chart_figure(prueba.yearly_sales()), None),
+    ]
+
+    # What the ingest job of an upload does, into a new history each call
+    if rows <= MAX_UPLOAD_ROWS:
+        contents = upload_contents(frame)
+        target = lambda: tempfile.mkdtemp(dir=directory)
+        cases.append(('append_upload', lambda: append_upload(upload_to_file(contents), prueba.upload_columns, target(),
+                                                             VIDEO_GAME_KEY, upload_digest(contents)), None, True))
+
+    return [case if len(case) == 4 else case + (False,) for case in cases]
+
+
+def percentiles(timings):
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    return float(p50), float(p99)
+
+
+def peak_bytes(call):
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def timings_of(call, repeat):
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat and (len(timings) < 3 or time.perf_counter() - started < CASE_SECONDS):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+# Run in the child process: measure every case of one module at one size
+def measure(module_name, rows, repeat):
+    from plotly.io.json import to_json_plotly
+
+    memo.result_cache = NoCache()
+
+    rng = np.random.default_rng(0)
+    directory = os.getcwd()
+    cases = (demo_cases if module_name == 'demo' else prueba_cases)(rows, rng, directory)
+    server = sys.modules[module_name].server
+    client = server.test_client()
+
+    results = []
+    for name, call, request, upload in cases:
+        times = min(repeat, UPLOAD_REPEAT) if upload else repeat
+
+        value = call()  # Loads the data into this worker first
+        size = None if upload else len(to_json_plotly(value))
+        results.append({'module': module_name, 'case': name, 'path': 'direct', 'rows': rows,
+                        **dict(zip(['p50', 'p99'], percentiles(timings_of(call, times)))),
+                        'peak_mb': peak_bytes(call) / 1024 ** 2, 'bytes': size})
+
+        if request is None:
+            continue
+
+        def post():
+            response = client.post('/_dash-update-component', json=request)
+            assert response.status_code in (200, 204), (name, response.status_code)
+            return response
+
+        size = len(post().data)
+        results.append({'module': module_name, 'case': name, 'path': 'client', 'rows': rows,
+                        **dict(zip(['p50', 'p99'], percentiles(timings_of(post, times)))),
+                        'peak_mb': peak_bytes(post) / 1024 ** 2, 'bytes': size})
+
+    return results
+
+
+def run_child(module_name, rows, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, PYTHONPATH=REPO_DIR, DATASTORE_DIR=os.path.join(directory, 'store'),
+                   MEMO_DIR=os.path.join(directory, 'memo'), METRICS_DIR=os.path.join(directory, 'metrics'))
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_callbacks', '--child', module_name,
+                                 '--rows', str(rows), '--repeat', str(repeat)],
+                                cwd=directory, env=env, capture_output=True, text=True)
+        if output.returncode != 0:
+            sys.stderr.write(output.stderr)
+            output.check_returncode()
+        return json.loads(output.stdout.splitlines()[-1])
+
+
+def result_key(result):
+    return f"{result['module']}:{result['case']}:{result['path']}:{result['rows']}"
+
+
+# Ratio of p50 to the baseline, and whether this result is a regression
+def compare(result, baseline, tolerance):
+    previous = baseline.get(result_key(result))
+    if previous is None:
+        return None, False
+
+    ratio = result['p50'] / previous['p50'] if previous['p50'] else 1.0
+    grew = result['bytes'] is not None and previous['bytes'] and result['bytes'] > previous['bytes'] * (1 + tolerance)
+    return ratio, ratio > 1 + tolerance or bool(grew)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--modules', nargs='+', default=MODULES, choices=MODULES)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--save', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.rows[0], args.repeat)))
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    print(f'{"module":<16}{"case":<26}{"path":<8}{"rows":>11}{"p50 ms":>10}{"p99 ms":>10}'
+          f'{"peak MB":>9}{"KB":>9}{"vs base":>9}')
+
+    results, regressions = [], []
+    for module_name in args.modules:
+        for rows in args.rows:
+            for result in run_child(module_name, rows, args.repeat):
+                ratio, regressed = compare(result, baseline, args.tolerance)
+                size = '-' if result['bytes'] is None else f"{result['bytes'] / 1024:.1f}"
+                versus = '-' if ratio is None else f'{ratio:.2f}x' + (' !' if regressed else '')
+                print(f"{module_name:<16}{result['case']:<26}{result['path']:<8}{rows:>11,}{result['p50']:>10.2f}"
+                      f"{result['p99']:>10.2f}{result['peak_mb']:>9.1f}{size:>9}{versus:>9}")
+                results.append(result)
+                if regressed:
+                    regressions.append(result_key(result))
+
+    if args.save:
+        baseline.update({result_key(result): result for result in results})
+        with open(args.baseline, 'w') as handle:
+            json.dump(baseline, handle, indent=1, sort_keys=True)
+        print(f'baseline saved to {args.baseline}')
+
+    if regressions:
+        print(f'{len(regressions)} regressions over {args.tolerance:.0%}: ' + ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# Speedup of the aggregation engines in engine.py over single-threaded
+# pandas, by number of workers: the cube groupby of the video-game history on
+# a frame in memory ('threads'), and the per-partition cubes of the same rows
+# stored as Feather partitions ('processes'). Speedup is bounded by the cores
+# of the machine; the merged results are checked against pandas.
+#
+#   python -m benchmarks.bench_engine [rows] [partitions]
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+
+from aggregates import CUBE_KEYS, SALES_COLUMNS, merge_cubes, partition_cube
+from benchmarks.generators import video_games
+from engine import PandasEngine, ProcessEngine, ThreadedEngine
+from partitions import PartitionedDataset
+from schemas import VIDEO_GAME_SALES, enforce_schema
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main(rows=8_000_000, partitions=8):
+    rng = np.random.default_rng(0)
+    frame = enforce_schema(video_games(rows, rng), VIDEO_GAME_SALES)
+    worker_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+
+    print(f'{rows:,} rows, {os.cpu_count()} cores')
+
+    baseline, expected = timed(lambda: PandasEngine().groupby_sum(frame, CUBE_KEYS, SALES_COLUMNS, dropna=False))
+    print(f'{"groupby in memory":<20}{"workers":>8}{"seconds":>10}{"speedup":>10}')
+    print(f'{"pandas":<20}{1:>8}{baseline:>10.2f}{1:>10.2f}')
+    for workers in worker_counts:
+        engine = ThreadedEngine(workers)
+        elapsed, result = timed(lambda: engine.groupby_sum(frame, CUBE_KEYS, SALES_COLUMNS, dropna=False))
+        assert np.allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-4)
+        print(f'{"threads":<20}{workers:>8}{elapsed:>10.2f}{baseline / elapsed:>10.2f}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = PartitionedDataset(directory)
+        for part in np.array_split(np.arange(rows), partitions):
+            dataset.append(frame.iloc[part[0]:part[-1] + 1])
+        entries = dataset.read_manifest()['partitions']
+        cube_of = partial(partition_cube, dataset, VIDEO_GAME_SALES)
+
+        print(f'{"cube of partitions":<20}{"workers":>8}{"seconds":>10}{"speedup":>10}')
+        baseline, expected = timed(lambda: merge_cubes(PandasEngine().map(cube_of, entries)))
+        print(f'{"pandas":<20}{1:>8}{baseline:>10.2f}{1:>10.2f}')
+        for workers in worker_counts:
+            engine = ProcessEngine(workers)
+            engine.map(cube_of, entries)  # Start the pool and its imports before timing
+            elapsed, result = timed(lambda: merge_cubes(engine.map(cube_of, entries)))
+            assert np.allclose(result[SALES_COLUMNS].to_numpy(), expected[SALES_COLUMNS].to_numpy())
+            print(f'{"processes":<20}{workers:>8}{elapsed:>10.2f}{baseline / elapsed:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,117 @@
+# Micro-benchmark of the figure builders: per-row/per-category trace loops
+# (as update_charts and update_time_series_chart used to build them) against
+# the single-trace builders in figures.py.
+#
+#   python -m benchmarks.bench_figures [locations]
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+from aggregates import build_genre_index, genre_series_until
+from figures import category_bar_trace, line_traces, map_trace
+
+
+def legacy_map(grouped_data):
+    map_fig = go.Figure()
+    for _, row in grouped_data.iterrows():
+        city = row['City']
+        total = row['gross income']
+        color = '#E9967A' if city in ('Mandalay', 'Naypyitaw', 'Yangon') else '#63feb9'
+        map_fig.add_trace(go.Scattermapbox(
+            lat=[row['Latitude']], lon=[row['Longitude']], mode='markers+text',
+            marker=dict(size=max(15, total / 200), color=color, opacity=0.7),
+            text=f'{city}: {total}', name=city, hoverinfo='text',
+        ))
+    return map_fig
+
+
+def vectorized_map(grouped_data):
+    return go.Figure(map_trace(grouped_data['Latitude'], grouped_data['Longitude'],
+                               grouped_data['City'], grouped_data['gross income']))
+
+
+def legacy_bar(rows):
+    fig = go.Figure()
+    order = rows.groupby('Product line')['gross income'].sum().sort_values(ascending=False).index
+    for product_line in order:
+        total = rows[rows['Product line'] == product_line]['gross income'].sum()
+        fig.add_trace(go.Bar(x=[product_line], y=[total], name=product_line))
+    return fig
+
+
+def vectorized_bar(rows):
+    totals = rows.groupby('Product line')['gross income'].sum().sort_values(ascending=False)
+    return go.Figure(category_bar_trace(totals.index, totals.values))
+
+
+def legacy_time_series(cube, genres):
+    df = cube[(cube['Year'] <= 2020) & cube['Genre'].isin(genres)]
+    df = df.groupby(['Year', 'Genre'])['Global_Sales'].sum().reset_index()
+    df['Global_Sales'] = df['Global_Sales'].round(2)
+    return {'data': [{
+        'x': df[df['Genre'] == g]['Year'], 'y': df[df['Genre'] == g]['Global_Sales'],
+        'type': 'line', 'mode': 'lines+markers', 'name': g,
+        'text': df[df['Genre'] == g]['Global_Sales'].astype(str), 'hoverinfo': 'x+text',
+    } for g in genres]}
+
+
+def vectorized_time_series(index, genres):
+    series = {g: genre_series_until(index, g, 2020) for g in genres}
+    return {'data': line_traces(series, genres)}
+
+
+def measure(build, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = build(*args)
+        # Same encoder Dash uses for callback responses
+        payload = json.dumps(fig, cls=PlotlyJSONEncoder)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, len(payload)
+
+
+def main(locations=2000):
+    rng = np.random.default_rng(0)
+    cities = np.array(['Yangon', 'Mandalay', 'Naypyitaw'])
+
+    grouped = pd.DataFrame({
+        'Latitude': rng.uniform(16, 22, locations).round(4),
+        'Longitude': rng.uniform(94, 98, locations).round(4),
+        'City': cities[rng.integers(0, 3, locations)],
+        'gross income': rng.uniform(0, 5000, locations).round(2),
+    })
+    rows = pd.DataFrame({
+        'Product line': np.array(['Health and beauty', 'Sports and travel', 'Fashion accessories',
+                                  'Home and lifestyle', 'Food and beverages'])[rng.integers(0, 5, 200_000)],
+        'gross income': rng.uniform(0, 50, 200_000),
+    })
+    genres = ['Action', 'Adventure', 'Role-Playing', 'Sports', 'Shooter', 'Simulation', 'Strategy', 'Puzzle', 'Misc']
+    cube = pd.DataFrame({
+        'Year': np.repeat(np.arange(1980, 2021, dtype=float), len(genres)),
+        'Genre': genres * 41,
+        'Platform': 'PS2',
+        'Global_Sales': rng.uniform(0, 100, 41 * len(genres)),
+    })
+    index = build_genre_index(cube)
+
+    cases = [
+        (f'map ({locations} locations)', (legacy_map, grouped), (vectorized_map, grouped)),
+        ('product line bar', (legacy_bar, rows), (vectorized_bar, rows)),
+        ('genre time series', (legacy_time_series, cube, genres), (vectorized_time_series, index, genres)),
+    ]
+
+    print(f'{"figure":<28}{"before ms":>12}{"after ms":>12}{"before bytes":>15}{"after bytes":>15}')
+    for name, (old, *old_args), (new, *new_args) in cases:
+        old_ms, old_bytes = measure(old, *old_args)
+        new_ms, new_bytes = measure(new, *new_args)
+        print(f'{name:<28}{old_ms:>12.1f}{new_ms:>12.1f}{old_bytes:>15,}{new_bytes:>15,}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,58 @@
+# Peak memory of one upload: the original decode/parse path of update_charts
+# and parse_contents against the streamed, chunked path in ingest.py. The
+# data URL itself is built before measuring, as Dash hands it to callbacks.
+#
+#   python -m benchmarks.bench_ingest [rows]
+import base64
+import io
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import demo
+from benchmarks.generators import supermarket, upload_contents
+from ingest import read_upload
+
+
+def legacy_read(contents, columns):
+    content_type, content_string = contents.split(',')
+    decoded = base64.b64decode(content_string)
+    data = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
+    data['Date'] = pd.to_datetime(data['Date'])
+    return data
+
+
+def streamed_read(contents, columns):
+    return read_upload(contents, columns)
+
+
+def make_upload(rows):
+    return upload_contents(supermarket(rows, np.random.default_rng(0)))
+
+
+def measure(read, contents):
+    tracemalloc.start()
+    start = time.perf_counter()
+    frame = read(contents, demo.upload_columns)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, int(frame.memory_usage(deep=True).sum())
+
+
+def main(rows=500_000):
+    contents = make_upload(rows)
+    mb = 1024 ** 2
+
+    print(f'{rows:,} rows, upload {len(contents) / mb:.1f} MB of base64')
+    print(f'{"path":<10}{"seconds":>10}{"peak MB":>10}{"frame MB":>10}{"peak/frame":>12}')
+    for name, read in [('legacy', legacy_read), ('streamed', streamed_read)]:
+        elapsed, peak, size = measure(read, contents)
+        print(f'{name:<10}{elapsed:>10.2f}{peak / mb:>10.1f}{size / mb:>10.1f}{peak / size:>12.2f}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,317 @@
+# Load test of one dashboard served by gunicorn on localhost: simulated
+# users replay interaction traces against /_dash-update-component, with
+# more users at each step, and the throughput, latency percentiles and error
+# rate of every step are reported together with the saturation point (the
+# step after which throughput stops growing, or errors appear).
+#
+# One upload is submitted to the ingest callback first, as an analyst loading
+# a file would, and its job polled until stored; every user then works on
+# that data:
+#   prueba_emiliano  sweeps year-slider, toggles genre-checklist-ts, changes
+#                    sales-dropdown and platform-dropdown
+#   demo             changes product-line-dropdown and city-dropdown, zooms
+#                    line-chart and pans map-chart
+# Users click as fast as the server answers (closed loop) unless --think is
+# given. The result cache is on, as in production, so repeated clicks hit it.
+#
+#   python -m benchmarks.bench_load [--module prueba_emiliano] [--workers 2] [--threads 4]
+#                                   [--users 1 2 4 8 16 32 64] [--duration 10] [--rows 100000]
+#
+# The load generator shares the machine with the server; on few cores it
+# takes cores the workers would otherwise use.
+import argparse
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from benchmarks.bench_callbacks import callback_request
+from benchmarks.generators import GENRES, PLATFORMS, PRODUCT_LINES, supermarket, upload_contents, video_games
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DISPATCH = '/_dash-update-component'
+DEPENDENCIES = '/_dash-dependencies'
+
+# Seconds to wait for gunicorn to answer and for the upload to be ingested
+STARTUP_SECONDS = 120
+
+# A step saturates the server when it adds less throughput than this, or
+# fails more requests than ERROR_RATE
+MIN_GAIN = 0.1
+ERROR_RATE = 0.01
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(module_name, workers, threads, directory, port):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, DATASTORE_DIR=os.path.join(directory, 'store'))
+    log = open(os.path.join(directory, 'gunicorn.log'), 'w')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+         '--workers', str(workers), '--threads', str(threads), '--bind', f'127.0.0.1:{port}',
+         f'{module_name}:server'],
+        cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + STARTUP_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited, see {log.name}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/_dash-layout')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start in time')
+
+
+# One keep-alive connection per user; a failed request reconnects
+class Client:
+    def __init__(self, port):
+        self.port = port
+        self.connection = None
+
+    def post(self, body):
+        return self.request('POST', DISPATCH, json.dumps(body))
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def request(self, method, path, body=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            self.connection.request(method, path, body, {'Content-Type': 'application/json'})
+            response = self.connection.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            return None, None
+        return response.status, json.loads(payload) if response.status == 200 else None
+
+
+# Outputs of the callback fired by `input` ('id.property'), as the page
+# declares them: an output shared by two callbacks carries a suffix
+def callback_outputs(client, input):
+    status, dependencies = client.get(DEPENDENCIES)
+    if status != 200:
+        raise RuntimeError(f'{DEPENDENCIES} failed with status {status}')
+    for callback in dependencies:
+        if any(f"{item['id']}.{item['property']}" == input for item in callback['inputs']):
+            output = callback['output'].strip('.')
+            return [tuple(item.split('.', 1)) for item in output.split('...')]
+    raise RuntimeError(f'no callback takes {input}')
+
+
+# Post an upload to the ingest callback once, then poll the job with the
+# callback of ingest-poll, which is sent only the job, until the data is
+# stored; returns the outputs of the last poll
+def upload(client, outputs, inputs, state=()):
+    status, response = client.post(callback_request(outputs, inputs, state))
+    if status != 200:
+        raise RuntimeError(f'upload failed with status {status}')
+    outputs_sent = response['response']
+    if outputs_sent.get('ingest-poll', {}).get('disabled'):
+        return outputs_sent
+
+    job = outputs_sent['ingest-job']['data']
+    poll_outputs = callback_outputs(client, 'ingest-poll.n_intervals')
+    deadline = time.monotonic() + STARTUP_SECONDS
+    n_intervals = 0
+    while time.monotonic() < deadline:
+        n_intervals += 1
+        time.sleep(0.5)
+        status, response = client.post(callback_request(poll_outputs, [('ingest-poll', 'n_intervals', n_intervals)],
+                                                         [('ingest-job', 'data', job)]))
+        if status != 200:
+            raise RuntimeError(f'upload poll failed with status {status}')
+        outputs_sent = response['response']
+        if outputs_sent.get('ingest-poll', {}).get('disabled'):
+            return outputs_sent
+    raise RuntimeError('upload not ingested in time')
+
+
+# The version of the data a prueba_emiliano.py page shows, an input of its
+# figure callbacks; it never changes during a run
+DATA_VERSION = ('data-version', 'data', None)
+
+
+# Upload the history, then return the session script of one user
+def prueba_session(client, rows):
+    contents = upload_contents(video_games(rows, np.random.default_rng(0)))
+    upload(client,
+           [('output-data-upload', 'children'), ('ingest-job', 'data'), ('ingest-poll', 'disabled'),
+            ('upload-data', 'contents')],
+           [('upload-data', 'contents', contents)], [('upload-data', 'filename', 'vgsales.csv')])
+
+    # Inputs in the order the callbacks declare them; `changed` is the one clicked
+    def script(rng):
+        sales = 'Global_Sales'
+        steps = []
+        # Sweep the year slider from end to end
+        for year in range(1980, 2021):
+            steps.append(callback_request([('bar-chart', 'figure')],
+                                          [('year-slider', 'value', year), ('sales-dropdown', 'value', sales),
+                                           DATA_VERSION]))
+        # Toggle genres on and off at a few years
+        for year in rng.choice(range(1980, 2021), 5):
+            genres = [genre for genre in GENRES if rng.random() < 0.6]
+            steps.append(callback_request([('time-series-chart', 'figure')],
+                                          [('year-slider-ts', 'value', int(year)), ('genre-checklist-ts', 'value', genres),
+                                           DATA_VERSION],
+                                          changed=['genre-checklist-ts.value']))
+        for sales in ['NA_Sales', 'EU_Sales', 'JP_Sales', 'Other_Sales', 'Global_Sales']:
+            steps.append(callback_request([('bar-chart', 'figure')],
+                                          [('year-slider', 'value', 2010), ('sales-dropdown', 'value', sales),
+                                           DATA_VERSION],
+                                          changed=['sales-dropdown.value']))
+        for platform in rng.choice(PLATFORMS, 3):
+            steps.append(callback_request([('sales-graph', 'figure')], [('platform-dropdown', 'value', str(platform)),
+                                                                    DATA_VERSION]))
+        return steps
+
+    return script
+
+
+def demo_session(client, rows):
+    contents = upload_contents(supermarket(rows, np.random.default_rng(0)))
+    stored = upload(client,
+                    [('data-store', 'data'), ('ingest-job', 'data'), ('ingest-status', 'children'),
+                     ('ingest-poll', 'disabled'), ('upload-data', 'contents')],
+                    [('upload-data', 'contents', contents)])
+    key = stored['data-store']['data']
+    data = ('data-store', 'data', key)
+
+    def script(rng):
+        steps = []
+        for product_line in rng.permutation(PRODUCT_LINES):
+            product_line = str(product_line)
+            for graph in ['line-chart', 'map-chart']:
+                steps.append(callback_request([(graph, 'figure')],
+                                              [data, ('product-line-dropdown', 'value', product_line),
+                                               (graph, 'relayoutData', None)],
+                                              changed=['product-line-dropdown.value']))
+            # Zoom the line chart into a month
+            start = np.datetime64('2019-01-01') + int(rng.integers(0, 900))
+            zoom = {'xaxis.range[0]': str(start), 'xaxis.range[1]': str(start + 30)}
+            steps.append(callback_request([('line-chart', 'figure')],
+                                          [data, ('product-line-dropdown', 'value', product_line),
+                                           ('line-chart', 'relayoutData', zoom)],
+                                          changed=['line-chart.relayoutData']))
+            # Zoom the map onto a city
+            lat, lon = 16.84 + rng.normal(0, 0.02), 96.17 + rng.normal(0, 0.02)
+            corners = [[lon - 0.1, lat + 0.1], [lon + 0.1, lat + 0.1], [lon + 0.1, lat - 0.1], [lon - 0.1, lat - 0.1]]
+            view = {'mapbox.zoom': 11, 'mapbox._derived': {'coordinates': corners}}
+            steps.append(callback_request([('map-chart', 'figure')],
+                                          [data, ('product-line-dropdown', 'value', product_line),
+                                           ('map-chart', 'relayoutData', view)],
+                                          changed=['map-chart.relayoutData']))
+        for city in rng.permutation(['Yangon', 'Mandalay', 'Naypyitaw']):
+            steps.append(callback_request([('bar-chart-product-line', 'figure')],
+                                          [data, ('city-dropdown', 'value', str(city))],
+                                          changed=['city-dropdown.value']))
+        steps.append(callback_request([('dashboard2-store', 'data')], [data]))
+        return steps
+
+    return script
+
+
+SESSIONS = {'prueba_emiliano': prueba_session, 'demo': demo_session}
+
+
+# Run `users` users for `duration` seconds; returns latencies of the
+# successful requests and the status of the failed ones (None when the
+# connection failed)
+def run_step(port, script, users, duration, think):
+    latencies, failures = [], []
+    deadline = time.monotonic() + duration
+
+    def user(seed):
+        client = Client(port)
+        for body in itertools.cycle(script(np.random.default_rng(seed))):
+            if time.monotonic() >= deadline:
+                return
+            start = time.perf_counter()
+            status, _ = client.post(body)
+            elapsed = time.perf_counter() - start
+            if status in (200, 204):
+                latencies.append(elapsed)
+            else:
+                failures.append(status)
+            if think:
+                time.sleep(think)
+
+    threads = [threading.Thread(target=user, args=(seed,)) for seed in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='prueba_emiliano', choices=list(SESSIONS))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--duration', type=float, default=10, help='seconds per step')
+    parser.add_argument('--think', type=float, default=0, help='seconds between the clicks of a user')
+    parser.add_argument('--rows', type=int, default=100_000, help='rows of the uploaded file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        server = start_server(args.module, args.workers, args.threads, directory, port)
+        try:
+            script = SESSIONS[args.module](Client(port), args.rows)
+
+            print(f'{args.module}: {args.workers} workers x {args.threads} threads, {args.rows:,} rows uploaded, '
+                  f'{args.duration:g} s per step')
+            print(f'{"users":>6}{"requests":>10}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}')
+
+            best, saturation = 0.0, None
+            for users in args.users:
+                latencies, failures = run_step(port, script, users, args.duration, args.think)
+                total = len(latencies) + len(failures)
+                throughput = len(latencies) / args.duration
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else (np.nan,) * 3
+                error_rate = len(failures) / total if total else 0.0
+                print(f'{users:>6}{total:>10}{throughput:>9.1f}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{error_rate:>8.1%}')
+                if failures:
+                    statuses = Counter('connection' if status is None else status for status in failures)
+                    print(f'{"":>6}failed: ' + ', '.join(f'{count} x {status}' for status, count in statuses.items()))
+
+                if saturation is None and (error_rate > ERROR_RATE or (best and throughput < best * (1 + MIN_GAIN))):
+                    saturation = (users, best)
+                best = max(best, throughput)
+        finally:
+            server.terminate()
+            server.wait()
+
+    if saturation is None:
+        print(f'not saturated at {args.users[-1]} users ({best:.1f} req/s)')
+    else:
+        users, throughput = saturation
+        print(f'saturated at {users} users: throughput levels off at about {throughput:.1f} req/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# Both query backends of datasets.py on the same stored data: peak memory of
+# a worker answering every chart of both dashboards, the time of each call,
+# and whether each call returns the same figure as the in-memory path.
+#
+# The data (one supermarket upload and a video-game history split into
+# partitions) is written once, then each backend runs in a fresh interpreter
+# that only reads it, so its peak RSS is what a server worker would hold.
+# Figures are compared as plotly JSON, numbers within a relative 1e-5
+# (sums of float32 columns are added up in another order by Arrow).
+#
+#   python -m benchmarks.bench_outofcore [--rows 100000 1000000 ...] [--partitions 8]
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ['memory', 'arrow']
+
+DEFAULT_ROWS = [100_000, 1_000_000]
+
+# Relative difference under which two numbers of a figure are the same
+TOLERANCE = 1e-5
+
+
+# Run in a child process: store the datasets both backends read
+def setup(rows, partitions):
+    from benchmarks.generators import supermarket, video_games
+    from datastore import DatasetStore
+    from partitions import PartitionedDataset
+    from schemas import SUPERMARKET_SALES, VIDEO_GAME_KEY, VIDEO_GAME_SALES, enforce_schema
+
+    rng = np.random.default_rng(0)
+    DatasetStore().put('bench', enforce_schema(supermarket(rows, rng), SUPERMARKET_SALES))
+
+    history = PartitionedDataset('data', VIDEO_GAME_KEY)
+    frame = enforce_schema(video_games(rows, rng), VIDEO_GAME_SALES)
+    for part in np.array_split(np.arange(len(frame)), partitions):
+        history.append(frame.iloc[part].reset_index(drop=True))
+
+
+# (name, call) of every chart of both dashboards, called directly
+def cases():
+    from benchmarks.generators import GENRES, PRODUCT_LINES
+    from datasets import query
+    import demo
+    import prueba_emiliano as prueba
+
+    key, product_line, city = 'bench', PRODUCT_LINES[0], 'Yangon'
+    return [
+        ('demo update_dropdown_options', lambda: demo.update_dropdown_options(key, None, None, None, None)),
+        ('demo line_chart_figure', lambda: demo.line_chart_figure(key, product_line, None)),
+        ('demo map_chart_figure', lambda: demo.map_chart_figure(key, product_line, None)),
+        ('demo product_line_bar_figure', lambda: demo.product_line_bar_figure(key, city)),
+        ('demo update_city_bar', lambda: demo.update_city_bar(key)),
+        ('demo dashboard2_payload', lambda: demo.dashboard2_payload(key)),
+        ('demo update_pie_chart', lambda: demo.update_pie_chart(key, product_line)),
+        ('demo update_payment_count', lambda: demo.update_payment_count(key, city)),
+        ('demo gross_margin_figure', lambda: demo.gross_margin_figure(key, product_line, city, None)),
+        ('prueba render_content tab1', lambda: prueba.render_content('tab1')),
+        ('prueba render_content tab4', lambda: prueba.render_content('tab4')),
+        ('prueba gauge_figure', lambda: prueba.gauge_figure('PS2')),
+        ('prueba bar_chart_figure', lambda: prueba.bar_chart_figure(2000, 'NA_Sales')),
+        ('prueba time_series_figure', lambda: prueba.time_series_figure(2000, GENRES)),
+        ('prueba line_chart_figure', lambda: prueba.line_chart_figure(prueba.yearly_sales())),
+        # The filters the prueba charts apply, as queries of the rows
+        ('query genres x platform', lambda: query('video_game_sales', where={'Genre': GENRES[:3], 'Platform': 'PS2'},
+                                                  by='Year', values='NA_Sales')),
+        ('query year rows', lambda: query('video_game_sales', where={'Year': 2000},
+                                          values=['Genre', 'Global_Sales'])),
+    ]
+
+
+def peak_rss_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Run in a child process: every case once for its result, then timed
+def measure(repeat):
+    import memo
+    from benchmarks.bench_callbacks import NoCache
+    from plotly.io.json import to_json_plotly
+
+    memo.result_cache = NoCache()
+    started_mb = peak_rss_mb()
+
+    results = []
+    for name, call in cases():
+        value = call()
+        if hasattr(value, 'reset_index'):  # frames and series from query(); rows keep no labels
+            value = value.reset_index(drop=value.index.names == [None])
+            value = json.loads(value.to_json(orient='split', date_format='iso'))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+        results.append({'case': name, 'ms': float(np.median(timings)) * 1000,
+                        'result': json.loads(to_json_plotly(value))})
+
+    return {'rss_mb': peak_rss_mb(), 'started_mb': started_mb, 'results': results}
+
+
+# Whether two decoded JSON values are equal, numbers within TOLERANCE
+def same(a, b):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[key], b[key]) for key in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        return math.isclose(a, b, rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+    return a == b
+
+
+def run_child(directory, args, backend=None):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, DATASTORE_DIR=os.path.join(directory, 'store'),
+               MEMO_DIR=os.path.join(directory, 'memo'), METRICS_DIR=os.path.join(directory, 'metrics'),
+               DASHBOARD2_CLIENTSIDE='1', QUERY_BACKEND=backend or 'memory')
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_outofcore', *args],
+                            cwd=directory, env=env, capture_output=True, text=True)
+    if output.returncode != 0:
+        sys.stderr.write(output.stderr)
+        output.check_returncode()
+    lines = output.stdout.splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--partitions', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', choices=['setup', 'measure'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'setup':
+        setup(args.rows[0], args.partitions)
+        return
+    if args.child == 'measure':
+        print(json.dumps(measure(args.repeat)))
+        return
+
+    different = 0
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            run_child(directory, ['--child', 'setup', '--rows', str(rows), '--partitions', str(args.partitions)])
+            runs = {backend: run_child(directory, ['--child', 'measure', '--repeat', str(args.repeat)], backend)
+                    for backend in BACKENDS}
+
+        print(f'{rows:,} rows in {args.partitions} partitions; peak RSS '
+              + ', '.join(f'{backend} {run["rss_mb"]:.0f} MB' for backend, run in runs.items())
+              + f' (after imports {runs["memory"]["started_mb"]:.0f} MB)')
+        print(f'{"case":<32}' + ''.join(f'{backend + " ms":>12}' for backend in BACKENDS) + f'{"same":>7}')
+        for memory, arrow in zip(runs['memory']['results'], runs['arrow']['results']):
+            equal = same(memory['result'], arrow['result'])
+            different += not equal
+            print(f'{memory["case"]:<32}{memory["ms"]:>12.2f}{arrow["ms"]:>12.2f}{"yes" if equal else "NO":>7}')
+        print()
+
+    sys.exit(1 if different else 0)
+
+
+if __name__ == '__main__':
+    main()
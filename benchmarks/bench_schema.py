@@ -0,0 +1,62 @@
+# Filter latency and resident size of the sales frames loaded as plain
+# object strings and float64 (as pd.read_csv returns them) against the
+# declared schemas in schemas.py.
+#
+#   python -m benchmarks.bench_schema [rows]
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.generators import supermarket, video_games
+from schemas import SUPERMARKET_SALES, VIDEO_GAME_SALES, enforce_schema
+
+
+def best_of(query, frame, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query(frame)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+QUERIES = {
+    'supermarket': [
+        ("City == 'Yangon'", lambda df: df[df['City'] == 'Yangon']),
+        ('Product line & City', lambda df: df[(df['Product line'] == 'Health and beauty') & (df['City'] == 'Yangon')]),
+        ('groupby City', lambda df: df.groupby('City', observed=True)['gross income'].sum()),
+    ],
+    'video games': [
+        ("Platform == 'PS2'", lambda df: df[df['Platform'] == 'PS2']),
+        ('Genre.isin(4)', lambda df: df[df['Genre'].isin(['Action', 'Sports', 'Shooter', 'Misc'])]),
+        ('groupby Year, Genre', lambda df: df.groupby(['Year', 'Genre'], observed=True)['Global_Sales'].sum()),
+    ],
+}
+
+
+def main(rows=1_000_000):
+    rng = np.random.default_rng(0)
+    datasets = {
+        'supermarket': (supermarket(rows, rng), SUPERMARKET_SALES),
+        'video games': (video_games(rows, rng), VIDEO_GAME_SALES),
+    }
+    mb = 1024 ** 2
+
+    print(f'{rows:,} rows')
+    print(f'{"dataset / query":<40}{"object":>12}{"schema":>12}{"speedup":>10}')
+    for name, (plain, schema) in datasets.items():
+        typed = enforce_schema(plain, schema)
+
+        plain_mb = plain.memory_usage(deep=True).sum() / mb
+        typed_mb = typed.memory_usage(deep=True).sum() / mb
+        print(f'{name + " memory (MB)":<40}{plain_mb:>12.1f}{typed_mb:>12.1f}{plain_mb / typed_mb:>9.1f}x')
+
+        for label, query in QUERIES[name]:
+            before = best_of(query, plain)
+            after = best_of(query, typed)
+            print(f'{name + " " + label + " (ms)":<40}{before:>12.1f}{after:>12.1f}{before / after:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
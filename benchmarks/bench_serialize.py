@@ -0,0 +1,164 @@
+# Serialization time and bytes on the wire of the figures both dashboards
+# return, with the encoders dash can be given:
+#
+#   json          plotly's json engine (before orjson was installed)
+#   orjson        plotly's orjson engine, which it picks when installed
+#   orjson+typed  numeric trace arrays as plotly.js typed arrays (base64
+#                 buffers), then orjson
+#
+# The orjson payloads are compressed with gzip (level 6), brotli (level 4)
+# and zstd (level 3), the defaults of Flask-Compress; "wire KB" is the
+# smallest of those, as a browser accepting all three receives it. json was
+# sent uncompressed, so its wire size is its size, and "vs before" compares
+# with it. Figures are downsampled to about a point per pixel, so typed
+# arrays save little before compression and compress worse than decimal
+# text; the apps do not use them.
+# Every module and size runs in a fresh interpreter, as in bench_callbacks.
+#
+#   python -m benchmarks.bench_serialize [--rows 1000 100000 ...] [--repeat 20]
+import argparse
+import base64
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import memo
+from benchmarks.bench_callbacks import MODULES, NoCache, demo_cases, prueba_cases
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_ROWS = [1_000, 100_000, 1_000_000]
+
+# plotly.js names of the NumPy types it decodes from typed arrays
+TYPED_ARRAY_DTYPES = {'float64': 'f8', 'float32': 'f4', 'int32': 'i4', 'int16': 'i2', 'int8': 'i1',
+                      'uint32': 'u4', 'uint16': 'u2', 'uint8': 'u1'}
+
+
+# Copy of a value with its numeric arrays of 32 values or more as typed arrays
+def typed_arrays(value):
+    if isinstance(value, dict):
+        return {key: typed_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [typed_arrays(item) if isinstance(item, (dict, list, tuple)) else item for item in value]
+    if not hasattr(value, 'dtype') or getattr(value, 'ndim', 0) != 1 or len(value) < 32:
+        return value
+
+    values = np.asarray(value)
+    if values.dtype.name == 'int64' and len(values) and np.abs(values).max() < 2 ** 31:
+        values = values.astype(np.int32)
+    dtype = TYPED_ARRAY_DTYPES.get(values.dtype.name)
+    if dtype is None:
+        return value
+    buffer = np.ascontiguousarray(values, values.dtype.newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(buffer).decode()}
+
+
+# A figure (or dict figure) with the arrays of its traces as typed arrays
+def typed_figure(figure):
+    figure = figure.to_plotly_json() if hasattr(figure, 'to_plotly_json') else figure
+    return dict(figure, data=typed_arrays(figure['data']))
+
+
+def compressors():
+    import brotli
+
+    found = {'gzip': lambda data: gzip.compress(data, 6), 'br': lambda data: brotli.compress(data, quality=4)}
+    try:
+        from compression import zstd
+    except ImportError:
+        try:
+            from backports import zstd
+        except ImportError:
+            return found
+    found['zstd'] = lambda data: zstd.compress(data, 3)
+    return found
+
+
+def median_ms(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+# Run in the child process: every figure case of one module at one size
+def measure(module_name, rows, repeat):
+    from plotly.io.json import to_json_plotly
+
+    memo.result_cache = NoCache()
+    cases = (demo_cases if module_name == 'demo' else prueba_cases)(rows, np.random.default_rng(0), os.getcwd())
+    compress = compressors()
+
+    encoders = {
+        'json': lambda figure: to_json_plotly(figure, engine='json'),
+        'orjson': lambda figure: to_json_plotly(figure, engine='orjson'),
+        'orjson+typed': lambda figure: to_json_plotly(typed_figure(figure), engine='orjson'),
+    }
+
+    results = []
+    for name, call, _, upload in cases:
+        if upload:
+            continue
+        figure = call()
+        value = figure.to_plotly_json() if hasattr(figure, 'to_plotly_json') else figure
+        if not isinstance(value, dict) or 'data' not in value:  # e.g. the Dashboard 2 payload
+            continue
+
+        for encoder, encode in encoders.items():
+            payload = encode(figure).encode()
+            sizes = {algorithm: len(compressor(payload)) for algorithm, compressor in compress.items()}
+            results.append({'module': module_name, 'case': name, 'rows': rows, 'encoder': encoder,
+                            'ms': median_ms(lambda: encode(figure), repeat), 'bytes': len(payload),
+                            'wire': len(payload) if encoder == 'json' else min(sizes.values()),
+                            'compressed': sizes})
+    return results
+
+
+def run_child(module_name, rows, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, PYTHONPATH=REPO_DIR, DATASTORE_DIR=os.path.join(directory, 'store'),
+                   MEMO_DIR=os.path.join(directory, 'memo'), METRICS_DIR=os.path.join(directory, 'metrics'))
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_serialize', '--child', module_name,
+                                 '--rows', str(rows), '--repeat', str(repeat)],
+                                cwd=directory, env=env, capture_output=True, text=True)
+        if output.returncode != 0:
+            sys.stderr.write(output.stderr)
+            output.check_returncode()
+        return json.loads(output.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--modules', nargs='+', default=MODULES, choices=MODULES)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.rows[0], args.repeat)))
+        return
+
+    print(f'{"module":<16}{"case":<26}{"rows":>11}  {"encoder":<14}{"ms":>8}{"KB":>9}{"wire KB":>9}{"vs before":>11}')
+    for module_name in args.modules:
+        for rows in args.rows:
+            before = {}
+            for result in run_child(module_name, rows, args.repeat):
+                if result['encoder'] == 'json':
+                    before[result['case']] = result
+                base = before[result['case']]
+                print(f"{module_name:<16}{result['case']:<26}{rows:>11,}  {result['encoder']:<14}{result['ms']:>8.2f}"
+                      f"{result['bytes'] / 1024:>9.1f}{result['wire'] / 1024:>9.1f}"
+                      f"{result['wire'] / base['wire']:>11.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Cold start of each dashboard in a fresh interpreter: seconds from spawning
+# the process until the module is imported, the page and layout are served,
+# and the first chart callback answers. "eager" calls warm_up() right after
+# the import, which is what every worker used to pay before serving (and what
+# a gunicorn --preload master now pays once); "lazy" is a worker started
+# without --preload.
+#
+#   python -m benchmarks.bench_startup [rows]
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.generators import supermarket, video_games
+from datastore import DatasetStore
+from partitions import PartitionedDataset
+from schemas import SUPERMARKET_SALES, VIDEO_GAME_SALES, enforce_schema
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+module_name, mode, chart_request = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+module = __import__(module_name)
+imported = time.time()
+if mode == 'eager':
+    module.warm_up()
+client = module.server.test_client()
+for path in ['/', '/_dash-layout', '/_dash-dependencies']:
+    assert client.get(path).status_code == 200
+served = time.time()
+assert client.post('/_dash-update-component', json=chart_request).status_code == 200
+charted = time.time()
+print(json.dumps([imported, served, charted]))
+'''
+
+
+def figure_request(output, inputs):
+    return {
+        'output': output,
+        'outputs': {'id': output.split('.')[0], 'property': 'figure'},
+        'inputs': [{'id': id, 'property': prop, 'value': value} for id, prop, value in inputs],
+        'changedPropIds': [f'{id}.{prop}' for id, prop, _ in inputs],
+        'state': [],
+    }
+
+
+def start(module_name, mode, chart_request, directory):
+    # A result cache of its own, so the chart is computed in every run
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, DATASTORE_DIR=os.path.join(directory, 'store'),
+               MEMO_DIR=os.path.join(directory, f'memo-{module_name}-{mode}'))
+    spawned = time.time()
+    output = subprocess.run([sys.executable, '-c', CHILD, module_name, mode, json.dumps(chart_request)],
+                            cwd=directory, env=env, capture_output=True, text=True, check=True).stdout
+    return [moment - spawned for moment in json.loads(output.splitlines()[-1])]
+
+
+def main(rows=200_000):
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Stored data as each app finds it: an upload in the shared store and
+        # the partitions of the video-game history
+        key = DatasetStore(os.path.join(directory, 'store')).put('bench', enforce_schema(supermarket(rows, rng), SUPERMARKET_SALES))
+        PartitionedDataset(os.path.join(directory, 'data')).append(enforce_schema(video_games(rows, rng), VIDEO_GAME_SALES))
+
+        charts = {
+            'demo': figure_request('bar-chart-city.figure', [('data-store', 'data', key)]),
+            'prueba_emiliano': figure_request('bar-chart.figure', [('year-slider', 'value', 2000),
+                                                                   ('sales-dropdown', 'value', 'Global_Sales')]),
+        }
+
+        print(f'{rows:,} rows per dataset, seconds since the process was spawned')
+        print(f'{"module":<18}{"mode":<8}{"imported":>10}{"served":>10}{"chart":>10}')
+        for module_name, chart_request in charts.items():
+            for mode in ['eager', 'lazy']:
+                imported, served, charted = start(module_name, mode, chart_request, directory)
+                print(f'{module_name:<18}{mode:<8}{imported:>10.2f}{served:>10.2f}{charted:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
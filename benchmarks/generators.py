@@ -0,0 +1,70 @@
+# Synthetic datasets in the shape of the files each dashboard is fed: the
+# supermarket sales of demo.py and the vgsales history of prueba_emiliano.py.
+# Frames come back as pd.read_csv would return them (object strings, floats);
+# pass them through schemas.enforce_schema for the typed frames the apps keep.
+# Values only depend on the seed of rng, so runs can be compared.
+import base64
+
+import numpy as np
+import pandas as pd
+
+CITIES = {'Yangon': (16.84, 96.17), 'Mandalay': (21.96, 96.08), 'Naypyitaw': (19.76, 96.07)}
+
+PRODUCT_LINES = ['Health and beauty', 'Sports and travel', 'Fashion accessories',
+                 'Home and lifestyle', 'Food and beverages', 'Electronic accessories']
+
+GENRES = ['Action', 'Sports', 'Misc', 'Role-Playing', 'Shooter', 'Adventure',
+          'Racing', 'Platform', 'Simulation', 'Fighting', 'Strategy', 'Puzzle']
+
+PLATFORMS = ['DS', 'PS2', 'PS3', 'Wii', 'X360', 'PSP', 'PS', 'PC', 'XB', 'GBA', 'GC', '3DS', 'PSV', 'PS4',
+             'N64', 'SNES', 'XOne', 'SAT', 'WiiU', '2600', 'GB', 'NES', 'DC', 'GEN', 'NG', 'SCD', 'WS',
+             '3DO', 'TG16', 'GG', 'PCFX']
+
+SALES_COLUMNS = ['Global_Sales', 'NA_Sales', 'EU_Sales', 'JP_Sales', 'Other_Sales']
+
+# Distinct game titles at most, whatever the number of rows
+MAX_TITLES = 100_000
+
+
+def _choice(values, rows, rng):
+    return np.array(values, dtype=object)[rng.integers(0, len(values), rows)]
+
+
+# Supermarket sales sorted by date, with locations scattered around each city
+def supermarket(rows, rng):
+    city = rng.integers(0, len(CITIES), rows)
+    centers = np.array(list(CITIES.values()))[city]
+    return pd.DataFrame({
+        'Date': pd.Timestamp('2019-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 1000, rows)), 'D'),
+        'City': np.array(list(CITIES), dtype=object)[city],
+        'Product line': _choice(PRODUCT_LINES, rows, rng),
+        'gross income': rng.gamma(2.0, 8.0, rows).round(4),
+        'Latitude': (centers[:, 0] + rng.normal(0, 0.05, rows)).round(5),
+        'Longitude': (centers[:, 1] + rng.normal(0, 0.05, rows)).round(5),
+        'Gender': _choice(['Male', 'Female'], rows, rng),
+        'Payment': _choice(['Cash', 'Ewallet', 'Credit card'], rows, rng),
+        'gross margin': rng.uniform(0, 5, rows).round(4),
+    })
+
+
+# vgsales rows: titles released on a platform in a year, with regional sales
+# that add up to the global ones
+def video_games(rows, rng):
+    titles = np.array([f'Game {i}' for i in range(min(rows, MAX_TITLES))], dtype=object)
+    regional = rng.exponential(0.15, (rows, 4)).round(2)
+    frame = pd.DataFrame({
+        'Name': titles[rng.integers(0, len(titles), rows)],
+        'Year': rng.integers(1980, 2021, rows).astype(float),
+        'Genre': _choice(GENRES, rows, rng),
+        'Platform': _choice(PLATFORMS, rows, rng),
+    })
+    for column, values in zip(SALES_COLUMNS[1:], regional.T):
+        frame[column] = values
+    frame['Global_Sales'] = regional.sum(axis=1).round(2)
+    return frame
+
+
+# The data URL dcc.Upload hands to a callback for frame saved as a CSV file
+def upload_contents(frame):
+    encoded = base64.b64encode(frame.to_csv(index=False).encode()).decode()
+    return 'data:text/csv;base64,' + encoded
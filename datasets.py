@@ -0,0 +1,295 @@
+import os
+import threading
+from collections import OrderedDict
+
+from datastore import STORE_DIR, DatasetStore
+from engine import get_engine
+from ingest import append_upload, concat_frames, store_upload
+from instrumentation import stage
+from lazy import lazy_import
+from memo import memoize
+from partitions import PartitionedDataset
+from rowindex import CategoryIndex
+from scanner import scan_aggregate, scan_distinct, scan_rows
+from schemas import SUPERMARKET_SALES, VIDEO_GAME_KEY, VIDEO_GAME_SALES, category_values, enforce_schema
+
+pd = lazy_import('pandas')
+
+# Data layer shared by both dashboards: every dataset is registered here by
+# name with its schema and storage, is written through one ingest job, and
+# is read through load() and query(). A dataset has versions, and a query
+# names the version it reads, so a cached result never outlives its data.
+
+# Where query() reads rows: 'memory' loads each dataset version into every
+# worker, with a row index; 'arrow' scans the version's Feather files for
+# each query (see scanner.py), so worker memory does not grow with the data
+QUERY_BACKEND = os.environ.get('QUERY_BACKEND', 'memory')
+
+# Directory of the video-game history, relative to the working directory as
+# prueba_emiliano.py has always kept it
+HISTORY_DIR = os.environ.get('HISTORY_DIR', 'data')
+
+# Aggregations query() accepts besides 'sum'; 'size' counts rows and needs
+# no values
+AGGREGATIONS = ('mean', 'min', 'max', 'count', 'size')
+
+# Versions of an uploaded dataset whose row index each worker keeps
+INDEXED_VERSIONS = 8
+
+
+# A dataset replaced by every upload: each upload is a version of its own,
+# named by its content hash, and each session keeps the version it shows.
+# The categorical columns listed in `index` get a row index (see rowindex.py).
+class UploadedDataset:
+    def __init__(self, name, schema, sort_by=None, index=(), directory=STORE_DIR):
+        self.name = name
+        self.schema = schema
+        self.sort_by = sort_by
+        self.indexed = list(index)
+        self.store = DatasetStore(directory)
+
+        # Row index of the versions used last; a version never changes, so
+        # its index stays valid whenever its frame is read again
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    # An upload is only read by naming its version; there is no latest one
+    def version(self):
+        return None
+
+    # Whether the upload with this content hash is stored
+    def contains(self, digest):
+        return self.store.contains(digest)
+
+    # Parse a decoded upload into version `digest` and return the version
+    def ingest(self, path, digest):
+        return store_upload(path, self.schema, self.store.directory, digest, self.sort_by)
+
+    def load(self, version):
+        return self.store.get(version)
+
+    # Feather files of a version, None when it is not stored
+    def files(self, version):
+        path = self.store.path(version)
+        return None if path is None else [path]
+
+    # (frame, row index) of a version, the index built on first use in this
+    # worker; (None, None) when the version is not stored
+    def load_indexed(self, version):
+        frame = self.load(version)
+        if frame is None:
+            return None, None
+
+        with self._lock:
+            index = self._indexes.get(version)
+            if index is not None:
+                self._indexes.move_to_end(version)
+                return frame, index
+
+        index = CategoryIndex.build(frame, self.indexed)
+        with self._lock:
+            self._indexes[version] = index
+            while len(self._indexes) > INDEXED_VERSIONS:
+                self._indexes.popitem(last=False)
+        return frame, index
+
+
+# A dataset every upload adds rows to, kept as append-only partitions; its
+# version changes with each write and only the latest one can be loaded
+class AppendedDataset:
+    def __init__(self, name, schema, key=None, index=(), directory=HISTORY_DIR):
+        self.name = name
+        self.schema = schema
+        self.key = key
+        self.indexed = list(index)
+        self.directory = directory
+        self._partitions = None
+
+        # Rows loaded by this process with their row index, and how many
+        # partitions they cover
+        self._frame = None
+        self._index = None
+        self._loaded = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    # Created on first use, so importing the registry creates no directory
+    @property
+    def partitions(self):
+        if self._partitions is None:
+            self._partitions = PartitionedDataset(self.directory, self.key)
+        return self._partitions
+
+    def contains(self, digest):
+        return self.partitions.has_upload(digest)
+
+    # Append the rows of a decoded upload not stored yet; returns how many
+    # rows were new and duplicate
+    def ingest(self, path, digest):
+        return append_upload(path, self.schema, self.directory, self.key, digest)
+
+    def version(self):
+        return self.partitions.manifest_version()
+
+    # Feather files of the latest version, one per partition
+    def files(self, version=None):
+        return [self.partitions.partition_path(entry) for entry in self.partitions.read_manifest()['partitions']]
+
+    # Rows of the latest version, in the current schema. Only the partitions
+    # written since the last call are read.
+    def load(self, version=None):
+        return self.load_indexed(version)[0]
+
+    # (frame, row index) of the latest version; the index is extended with
+    # the rows of the new partitions only
+    def load_indexed(self, version=None):
+        with self._lock:
+            version = self.version()
+            if self._frame is not None and version == self._version:
+                return self._frame, self._index
+
+            entries = self.partitions.read_manifest()['partitions']
+            new_frames = [enforce_schema(self.partitions.read_partition(entry), self.schema)
+                          for entry in entries[self._loaded:]]
+            frames = [self._frame] + new_frames if self._frame is not None and self._loaded else new_frames
+
+            if frames:
+                self._frame = concat_frames(frames)
+            else:
+                self._frame = enforce_schema(pd.DataFrame(), self.schema)
+            if self._index is None or not self._loaded:
+                self._index = CategoryIndex.build(self._frame, self.indexed)
+            else:
+                for frame in new_frames:
+                    self._index = self._index.extended(frame)
+
+            self._loaded = len(entries)
+            self._version = version
+            return self._frame, self._index
+
+
+DATASETS = {}
+
+
+def register(dataset):
+    DATASETS[dataset.name] = dataset
+    return dataset
+
+
+def get_dataset(name):
+    return DATASETS[name]
+
+
+# Supermarket sales uploaded to demo.py, sorted by date for the zoomed charts
+register(UploadedDataset('supermarket_sales', SUPERMARKET_SALES, sort_by='Date',
+                         index=['City', 'Product line', 'Gender', 'Payment']))
+
+# Video-game sales history of prueba_emiliano.py; a Name, Platform and Year
+# already stored is not added again
+register(AppendedDataset('video_game_sales', VIDEO_GAME_SALES, key=VIDEO_GAME_KEY,
+                         index=['Genre', 'Platform']))
+
+
+# Ingest job of every dataset: parse the decoded upload at `path` (removed
+# when done) into the named dataset. Runs in a JobQueue process, which only
+# receives the name.
+def ingest_file(name, path, digest):
+    return get_dataset(name).ingest(path, digest)
+
+
+# Rows of a dataset version matching `where`, a {column: value or list of
+# values} mapping. With `by`, `values` (a column or a list) are aggregated
+# by those columns with `agg` ('sum' or one of AGGREGATIONS); without it,
+# the matching rows themselves, only their `values` columns if given.
+# Aggregates are cached per version; row selections are cheap to redo and
+# too large to keep. The version of an uploaded dataset is its content hash;
+# appended datasets default to their latest. None when the version is not
+# stored, or not given for an uploaded dataset (e.g. before any upload).
+# Both backends (QUERY_BACKEND) return the same frames.
+def query(name, version=None, where=None, by=None, values=None, agg='sum'):
+    dataset = get_dataset(name)
+    if agg != 'sum' and agg not in AGGREGATIONS:
+        raise ValueError(f'Unknown aggregation {agg!r}')
+    if version is None:
+        version = dataset.version()
+    if version is None:
+        return None
+
+    if by is not None:
+        return _aggregate(name, version, where or {}, by, values, agg)
+
+    columns = [values] if isinstance(values, str) else values
+    if QUERY_BACKEND == 'arrow':
+        files = dataset.files(version)
+        return None if files is None else scan_rows(files, dataset.schema, where or {}, columns)
+
+    frame, index = dataset.load_indexed(version)
+    if frame is None:
+        return None
+    return select(frame, where or {}, index, columns)
+
+
+@memoize()
+def _aggregate(name, version, where, by, values, agg):
+    dataset = get_dataset(name)
+    if QUERY_BACKEND == 'arrow':
+        files = dataset.files(version)
+        return None if files is None else scan_aggregate(files, dataset.schema, where, by, values, agg)
+
+    frame, index = dataset.load_indexed(version)
+    if frame is None:
+        return None
+
+    frame = select(frame, where, index)
+    if agg == 'sum':
+        return get_engine().groupby_sum(frame, by, values)
+    with stage('groupby', len(frame)):
+        if agg == 'size':
+            return frame.groupby(by, observed=True).size()
+        return frame.groupby(by, observed=True)[values].agg(agg)
+
+
+# Sorted distinct values of a column in a dataset version, for dropdown and
+# checklist options; none when the version is not stored
+def distinct_values(name, column, version=None):
+    dataset = get_dataset(name)
+    if version is None:
+        version = dataset.version()
+    if version is None:
+        return []
+    if QUERY_BACKEND == 'arrow':
+        return _scanned_values(name, column, version)
+
+    frame, index = dataset.load_indexed(version)
+    if index is not None and column in index.columns:
+        return index.values(column)
+    return category_values(frame, column)
+
+
+@memoize()
+def _scanned_values(name, column, version):
+    dataset = get_dataset(name)
+    files = dataset.files(version)
+    return [] if files is None else scan_distinct(files, dataset.schema, column)
+
+
+# Rows of frame whose columns match `where`, with only the given columns
+# (all by default): only the matching rows are read when `index`, the row
+# index of frame, covers every column, and the whole columns are compared
+# otherwise
+def select(frame, where, index=None, columns=None):
+    selected = frame if columns is None else frame[columns]
+    if not where:
+        return selected
+
+    if index is not None and index.covers(where):
+        positions = index.lookup(where)
+        with stage('filter', len(positions)):
+            return selected.take(positions)
+
+    with stage('filter', len(frame)):
+        mask = None
+        for column, value in where.items():
+            matches = frame[column].isin(value) if isinstance(value, (list, tuple, set)) else frame[column] == value
+            mask = matches if mask is None else mask & matches
+        return selected[mask]
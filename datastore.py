@@ -0,0 +1,179 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from lazy import lazy_import
+
+pd = lazy_import('pandas')
+feather = lazy_import('pyarrow.feather')
+
+# Directory shared by every worker process of the server
+STORE_DIR = os.environ.get('DATASTORE_DIR', os.path.join(tempfile.gettempdir(), 'dash-datastore'))
+
+# Seconds a dataset may stay unused before it is evicted
+TTL_SECONDS = int(os.environ.get('DATASTORE_TTL', 2 * 60 * 60))
+
+# Bytes of Feather files kept on disk across all sessions
+DISK_BUDGET = int(os.environ.get('DATASTORE_DISK_BUDGET', 4 * 1024 ** 3))
+
+# Bytes of decoded frames each worker keeps in memory
+MEMORY_BUDGET = int(os.environ.get('DATASTORE_MEMORY_BUDGET', 512 * 1024 ** 2))
+
+
+# Exclusive lock on a file shared between worker processes
+@contextmanager
+def file_lock(path):
+    with open(path, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+# File handle whose content replaces path once the block ends, so readers in
+# other threads or workers never see a partial file. The content is written
+# to a file private to this thread first; it is dropped if the block fails.
+@contextmanager
+def atomic_write(path, mode='w'):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, mode) as handle:
+            yield handle
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Feather only stores frames with a default RangeIndex; avoid copying
+# frames that already have one
+def default_index(frame):
+    if frame.index.equals(pd.RangeIndex(len(frame))):
+        return frame
+    return frame.reset_index(drop=True)
+
+
+# Datasets stored as Feather files keyed by a handle. Every worker reads the
+# same files through a memory map and keeps a small LRU of decoded frames.
+class DatasetStore:
+    def __init__(self, directory=STORE_DIR, ttl=TTL_SECONDS, disk_budget=DISK_BUDGET,
+                 memory_budget=MEMORY_BUDGET):
+        self.directory = directory
+        self.ttl = ttl
+        self.disk_budget = disk_budget
+        self.memory_budget = memory_budget
+
+        self._frames = OrderedDict()  # key -> (frame, nbytes)
+        self._frames_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.feather')
+
+    def contains(self, key):
+        return bool(key) and os.path.exists(self._path(key))
+
+    # File of a stored dataset, for readers that scan it without loading it;
+    # touched as get() does. None when it is not stored.
+    def path(self, key):
+        if not self.contains(key):
+            return None
+        path = self._path(key)
+        self._touch(path)
+        return path
+
+    def put(self, key, frame):
+        path = self._path(key)
+
+        if not os.path.exists(path):
+            with atomic_write(path, 'wb') as handle:
+                feather.write_feather(default_index(frame), handle, compression='uncompressed')
+
+        self._touch(path)
+        self._remember(key, frame)
+        self.evict()
+
+        return key
+
+    def get(self, key):
+        if not key:
+            return None
+
+        path = self._path(key)
+
+        # Another worker may have evicted the file in the meantime
+        if not os.path.exists(path):
+            self._forget(key)
+            return None
+
+        self._touch(path)
+
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key][0]
+
+        frame = feather.read_feather(path, memory_map=True)
+        self._remember(key, frame)
+
+        return frame
+
+    def evict(self):
+        now = time.time()
+        entries = []
+
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.feather'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # Oldest first: drop expired files, then whatever exceeds the budget
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+
+        for mtime, size, path in entries:
+            if now - mtime <= self.ttl and total <= self.disk_budget:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._forget(os.path.basename(path)[:-len('.feather')])
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, key, frame):
+        nbytes = int(frame.memory_usage(deep=True).sum())
+
+        with self._lock:
+            if key in self._frames:
+                self._frames_bytes -= self._frames.pop(key)[1]
+
+            self._frames[key] = (frame, nbytes)
+            self._frames_bytes += nbytes
+
+            # Keep at least the frame just stored, even if it is over budget
+            while self._frames_bytes > self.memory_budget and len(self._frames) > 1:
+                _, (_, dropped) = self._frames.popitem(last=False)
+                self._frames_bytes -= dropped
+
+    def _forget(self, key):
+        with self._lock:
+            if key in self._frames:
+                self._frames_bytes -= self._frames.pop(key)[1]
@@ -1,39 +1,62 @@
-import pandas as pd
+import os
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
-import plotly.graph_objects as go
-import base64
-import io
-import plotly.express as px
-
-# Create the Dash application
-app = dash.Dash(__name__)
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from datasets import distinct_values, get_dataset, ingest_file, query
+from downsample import lttb_indices, minmax_indices, visible_slice, zoom_changed
+from figures import category_bar_trace, figure_patch, map_trace, triggered_only
+from ingest import upload_digest, upload_to_file
+from instrumentation import instrument
+from jobs import JobQueue
+from lazy import lazy_import, preload, preload_before_callbacks
+from memo import memoize
+from spatial import DEFAULT_ZOOM, bin_points, bounds_center, map_view
+
+# Imported on first use, so a worker can serve the layout before loading them
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+go = lazy_import('plotly.graph_objects')
+px = lazy_import('plotly.express')
+
+# Create the Dash application; DEMO_URL_PREFIX serves it under a path, as
+# wsgi.py does when it mounts both dashboards on one server. Responses are
+# compressed (Flask-Compress) for browsers that accept it: figure JSON
+# shrinks to a fifth or less (see benchmarks/bench_serialize.py).
+app = dash.Dash(__name__, requests_pathname_prefix=os.environ.get('DEMO_URL_PREFIX', '/'), compress=True)
+
+# Stage times, payload sizes and rows read by every callback, served at /metrics
+instrument(app)
+
+# The first callback request of a worker imports the libraries; others wait for it
+preload_before_callbacks(app, np, pd, go, px)
 
 server=app.server
 
-# List of "Product line" options
-product_line_options = [
-    'Health and beauty',
-    'Sports and travel',
-    'Fashion accessories',
-    'Home and lifestyle',
-    'Food and beverages',
-]
-
-# List of "City" options
-city_options = [
-    'Yangon',
-    'Mandalay',
-    'Naypyitaw',
-]
-
-# Data source
-data = None  # Initially, the data is empty
+# Data source: parsed uploads shared by all workers, keyed by content hash
+# (see datasets.py). Each browser session only keeps the key of its own
+# upload in 'data-store'.
+supermarket = get_dataset('supermarket_sales')
+
+# Columns the dashboards use and the types they are loaded with; the
+# "Product line" and "City" options come from the uploaded data
+upload_columns = supermarket.schema
+
+# Uploads are parsed by a background process pool, not in the request thread
+ingest_jobs = JobQueue()
+
+# Draw Dashboard 2 in the browser from one pre-aggregated payload per dataset
+# (set DASHBOARD2_CLIENTSIDE=0 to draw it on the server instead)
+clientside_dashboard2 = os.environ.get('DASHBOARD2_CLIENTSIDE', '1') != '0'
+
+# Pixel buckets of each gross margin series in that payload
+PAYLOAD_BUCKETS = 500
 
 # Layout of the dashboard with tabs
 app.layout = html.Div([
-    dcc.Store(id='data-store'), 
+    dcc.Store(id='data-store', storage_type='session'),
+    dcc.Store(id='ingest-job'),
+    dcc.Interval(id='ingest-poll', interval=500, disabled=True),
+    dcc.Store(id='dashboard2-store'),
      dcc.Tabs([
         dcc.Tab(label='Dashboard 1', children=[
             html.Div([
@@ -56,6 +79,8 @@ app.layout = html.Div([
                         },
                         multiple=False
                     ),
+                    # Progress of the upload being ingested
+                    html.Div(id='ingest-status'),
                 ], style={'display': 'flex', 'justify-content': 'space-between'}),
 
                 # Division for dropdown menus
@@ -63,7 +88,7 @@ app.layout = html.Div([
                     # Dropdown menu for "Product line"
                     dcc.Dropdown(
                         id='product-line-dropdown',
-                        options=[{'label': pl, 'value': pl} for pl in product_line_options],
+                        options=[],
                         value='Health and beauty',
                         style={'width': '220px'},
                     ),
@@ -81,7 +106,7 @@ app.layout = html.Div([
                         # Dropdown menu for "City" (above bar charts but not at the top)
                         dcc.Dropdown(
                             id='city-dropdown',
-                            options=[{'label': city, 'value': city} for city in city_options],
+                            options=[],
                             value='Yangon',
                             style={'width': '220px'},
                         ),
@@ -105,7 +130,7 @@ app.layout = html.Div([
                 html.Div([
                     dcc.Dropdown(
                         id='product-line-dropdown-2',
-                        options=[{'label': pl, 'value': pl} for pl in product_line_options],
+                        options=[],
                         value='Health and beauty',
                         style={'width': '50%'}
                     ),
@@ -115,7 +140,7 @@ app.layout = html.Div([
                 html.Div([
                     dcc.Dropdown(
                         id='city-dropdown-2',
-                        options=[{'label': city, 'value': city} for city in city_options],
+                        options=[],
                         value='Yangon',
                         style={'width': '50%'}
                     ),
@@ -130,95 +155,261 @@ app.layout = html.Div([
     ]),
 ])
 
+# An upload is submitted once: its contents are cleared as soon as the job
+# is queued, so the polls below never send the file again
 @app.callback(
-    [Output('line-chart', 'figure'),
-     Output('map-chart', 'figure'),
-     Output('bar-chart-product-line', 'figure'),
-     Output('bar-chart-city', 'figure')],
-    [Input('upload-data', 'contents'),
-     Input('product-line-dropdown', 'value'),
-     Input('city-dropdown', 'value')],
+    [Output('data-store', 'data'),
+     Output('ingest-job', 'data'),
+     Output('ingest-status', 'children'),
+     Output('ingest-poll', 'disabled'),
+     Output('upload-data', 'contents')],
+    Input('upload-data', 'contents'),
     prevent_initial_call=True
 )
-def update_charts(contents, selected_product_line, selected_city):
-    global data  # Access the global data variable
-
+def submit_upload(contents):
     if contents is None:
         raise dash.exceptions.PreventUpdate
 
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    data = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
+    key = upload_digest(contents)
+
+    # Already parsed for an earlier upload: swap it in right away
+    if supermarket.contains(key):
+        return key, None, '', True, None
 
-    data['Date'] = pd.to_datetime(data['Date'])
-    data = data.sort_values('Date')
+    # Only the decoding to a temporary file happens in the request thread
+    path = upload_to_file(contents)
+    job_id = ingest_jobs.submit(ingest_file, supermarket.name, path, key)
+
+    return dash.no_update, job_id, 'Loading 0%', False, None
+
+@app.callback(
+    [Output('data-store', 'data', allow_duplicate=True),
+     Output('ingest-job', 'data', allow_duplicate=True),
+     Output('ingest-status', 'children', allow_duplicate=True),
+     Output('ingest-poll', 'disabled', allow_duplicate=True)],
+    Input('ingest-poll', 'n_intervals'),
+    State('ingest-job', 'data'),
+    prevent_initial_call=True
+)
+def poll_upload(n_intervals, job_id):
+    if job_id is None:
+        raise dash.exceptions.PreventUpdate
+
+    status = ingest_jobs.status(job_id)
+
+    # The charts only switch to the new dataset once it is fully stored;
+    # only the content hash travels to the browser
+    if status['state'] == 'done':
+        return status['result'], None, '', True
+    if status['state'] == 'error':
+        return dash.no_update, None, f"Upload failed: {status['error']}", True
+
+    return dash.no_update, dash.no_update, f"Loading {status['progress']:.0%}", dash.no_update
+
+# Dropdown options from the distinct values of a column, and the value to
+# select: the current one while it is still offered, the first one otherwise
+def dropdown_choices(dataset_key, column, current):
+    values = distinct_values(supermarket.name, column, dataset_key)
+    value = dash.no_update if current in values or not values else values[0]
+    return [{'label': v, 'value': v} for v in values], value
+
+@app.callback(
+    [Output('product-line-dropdown', 'options'),
+     Output('product-line-dropdown', 'value'),
+     Output('city-dropdown', 'options'),
+     Output('city-dropdown', 'value'),
+     Output('product-line-dropdown-2', 'options'),
+     Output('product-line-dropdown-2', 'value'),
+     Output('city-dropdown-2', 'options'),
+     Output('city-dropdown-2', 'value')],
+    Input('data-store', 'data'),
+    [State('product-line-dropdown', 'value'),
+     State('city-dropdown', 'value'),
+     State('product-line-dropdown-2', 'value'),
+     State('city-dropdown-2', 'value')]
+)
+def update_dropdown_options(dataset_key, product_line, city, product_line_2, city_2):
+    if not supermarket.contains(dataset_key):
+        raise dash.exceptions.PreventUpdate
+
+    return (
+        *dropdown_choices(dataset_key, 'Product line', product_line),
+        *dropdown_choices(dataset_key, 'City', city),
+        *dropdown_choices(dataset_key, 'Product line', product_line_2),
+        *dropdown_choices(dataset_key, 'City', city_2),
+    )
+
+# relayoutData of a graph when this call was fired by a zoom or pan on it,
+# None when the figure must be drawn in full
+def zoom_request(graph_id, relayout_data):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+
+    if f'{graph_id}.relayoutData' not in triggered:
+        return None
+
+    # Relayout events that do not move the x axis (autosize, legend clicks) change nothing
+    if not zoom_changed(relayout_data):
+        raise dash.exceptions.PreventUpdate
+
+    return relayout_data
+
+@app.callback(
+    Output('line-chart', 'figure'),
+    [Input('data-store', 'data'),
+     Input('product-line-dropdown', 'value'),
+     Input('line-chart', 'relayoutData')],
+    prevent_initial_call=True
+)
+def update_line_chart(dataset_key, selected_product_line, relayout_data):
+    zoom = zoom_request('line-chart', relayout_data)
+    figure = line_chart_figure(dataset_key, selected_product_line, zoom)
+
+    # A zoom only replaces the points of the line
+    if zoom:
+        return figure_patch(figure, ['x', 'y'])
+    return figure
+
+# Figures are memoized on their arguments only: the dataset key is a content
+# hash, so a new upload never hits an old result
+@memoize()
+def line_chart_figure(dataset_key, selected_product_line, zoom):
+    # Daily totals are shared by every zoom into the same product line
+    daily_totals = query(supermarket.name, dataset_key, where={'Product line': selected_product_line},
+                         by='Date', values='gross income')
+
+    if daily_totals is None:
+        raise dash.exceptions.PreventUpdate
 
     line_fig = go.Figure()
 
-    filtered_data = data[data['Product line'] == selected_product_line]
-    grouped_data = filtered_data.groupby('Date')['gross income'].sum().reset_index()
+    grouped_data = daily_totals.reset_index()
+
+    # Keep the zoomed range only, then at most about one point per pixel
+    if zoom:
+        start, stop = visible_slice(grouped_data['Date'], zoom)
+        grouped_data = grouped_data.iloc[start:stop]
+    grouped_data = grouped_data.iloc[lttb_indices(grouped_data['Date'], grouped_data['gross income'])]
+
     line_fig.add_trace(go.Scatter(x=grouped_data['Date'], y=grouped_data['gross income'], mode='lines', name=selected_product_line))
 
     line_fig.update_layout(
         title=f'Sales in the {selected_product_line} department',
         xaxis_title='Date',
-        yaxis_title='Total'
+        yaxis_title='Total',
+        uirevision=f'{dataset_key}-{selected_product_line}'  # Keep the user's zoom while refining
     )
 
+    return line_fig
+
+# Each Dashboard 1 chart only depends on the data and the dropdown it is
+# filtered by. When just that dropdown changes, only the trace arrays and
+# titles that depend on it are sent; the rest of the figure stays as drawn.
+@app.callback(
+    Output('map-chart', 'figure'),
+    [Input('data-store', 'data'),
+     Input('product-line-dropdown', 'value'),
+     Input('map-chart', 'relayoutData')],
+    prevent_initial_call=True
+)
+def update_map_chart(dataset_key, selected_product_line, relayout_data):
+    marker_properties = ['lat', 'lon', 'marker.size', 'marker.color', 'text']
+
+    # A zoom or pan rebins the visible area and only replaces the markers
+    if triggered_only('map-chart.relayoutData'):
+        view = map_view(relayout_data)
+        if view is None:
+            raise dash.exceptions.PreventUpdate
+        return figure_patch(map_chart_figure(dataset_key, selected_product_line, view), marker_properties)
+
+    # Markers for the area the user is looking at; the map is only
+    # recentered while it has not been moved
+    if triggered_only('product-line-dropdown.value'):
+        view = map_view(relayout_data)
+        figure = map_chart_figure(dataset_key, selected_product_line, view)
+        return figure_patch(figure, marker_properties, [] if view else ['mapbox.center'])
+
+    return map_chart_figure(dataset_key, selected_product_line, None)
+
+# Bounds (west, south, east, north) of the locations of each product line,
+# computed once per dataset
+@memoize()
+def map_bounds(dataset_key):
+    low = query(supermarket.name, dataset_key, by='Product line', values=['Longitude', 'Latitude'], agg='min')
+    high = query(supermarket.name, dataset_key, by='Product line', values=['Longitude', 'Latitude'], agg='max')
+
+    return {
+        product_line: (float(low.at[product_line, 'Longitude']), float(low.at[product_line, 'Latitude']),
+                       float(high.at[product_line, 'Longitude']), float(high.at[product_line, 'Latitude']))
+        for product_line in low.index
+    }
+
+@memoize()
+def map_chart_figure(dataset_key, selected_product_line, view):
+    # Rows of the product line, read through the row index
+    filtered_data = query(supermarket.name, dataset_key, where={'Product line': selected_product_line},
+                          values=['Latitude', 'Longitude', 'City', 'gross income'])
+
+    if filtered_data is None:
+        raise dash.exceptions.PreventUpdate
+
     map_fig = go.Figure()
 
-    grouped_data = filtered_data.groupby(['Latitude', 'Longitude', 'City'])['gross income'].sum().reset_index()
+    # Locations closer than a marker at the current zoom become one marker,
+    # so the trace size depends on the screen rather than on the data
+    zoom, window = view or (DEFAULT_ZOOM, None)
+    grouped_data = bin_points(filtered_data, 'Latitude', 'Longitude', ['City'], 'gross income', zoom, window)
     grouped_data['gross income'] = grouped_data['gross income'].round(2)
 
-    for _, row in grouped_data.iterrows():
-        city = row['City']
-        total = row['gross income']
-        color = '#63feb9'  # Default color
-
-        if city == 'Mandalay':
-            color = '#E9967A'
-        elif city == 'Naypyitaw':
-            color = '#E9967A'
-        elif city == 'Yangon':
-            color = '#E9967A'
-
-        size = max(15, total / 200)  # Adjust the size calculation as needed
-
-        map_fig.add_trace(go.Scattermapbox(
-            lat=[row['Latitude']],
-            lon=[row['Longitude']],
-            mode='markers+text',
-            marker=dict(
-                size=size,
-                color=color,
-                opacity=0.7  # Set marker opacity to 50%
-            ),
-            text=f'{city}: {total}',  # Label with city name and total
-            name=city,  # City name for legend
-            hoverinfo='text'
-        ))
+    bounds = map_bounds(dataset_key).get(selected_product_line)
+
+    # A single trace carries every location
+    map_fig.add_trace(map_trace(
+        grouped_data['Latitude'],
+        grouped_data['Longitude'],
+        grouped_data['City'],
+        grouped_data['gross income'],
+    ))
 
     map_fig.update_layout(
         title=f'Presence in the country',
         showlegend=False,  # Remove the legend from the map
         mapbox_style="open-street-map",
-        mapbox_center={"lat": filtered_data['Latitude'].mean(), "lon": filtered_data['Longitude'].mean()},
-        mapbox_zoom=5,
+        mapbox_center=bounds_center(bounds) if bounds else None,
+        mapbox_zoom=DEFAULT_ZOOM,
         width=800,
         height=920,
+        uirevision=dataset_key,  # Keep the user's view while markers are rebinned
     )
 
+    return map_fig
+
+@app.callback(
+    Output('bar-chart-product-line', 'figure'),
+    [Input('data-store', 'data'),
+     Input('city-dropdown', 'value')],
+    prevent_initial_call=True
+)
+def update_product_line_bar(dataset_key, selected_city):
+    figure = product_line_bar_figure(dataset_key, selected_city)
+
+    if triggered_only('city-dropdown.value'):
+        return figure_patch(figure, ['x', 'y', 'marker.color'], ['title'])
+    return figure
+
+@memoize()
+def product_line_bar_figure(dataset_key, selected_city):
     # Bar chart for total gross income by Product line
-    filtered_data_bar_product_line = data[data['City'] == selected_city].dropna(subset=['Product line', 'gross income'])
-    bar_fig_product_line = go.Figure()
+    totals_product_line = query(supermarket.name, dataset_key, where={'City': selected_city},
+                                by='Product line', values='gross income')
 
-    # Sort categories by descending total
-    sorted_categories_product_line = filtered_data_bar_product_line.groupby('Product line')['gross income'].sum().sort_values(ascending=False).index
+    if totals_product_line is None:
+        raise dash.exceptions.PreventUpdate
 
-    for product_line in sorted_categories_product_line:
-        filtered_data_line_product_line = filtered_data_bar_product_line[filtered_data_bar_product_line['Product line'] == product_line]
-        total_income_product_line = filtered_data_line_product_line['gross income'].sum()
-        bar_fig_product_line.add_trace(go.Bar(x=[product_line], y=[total_income_product_line], name=product_line))
+    bar_fig_product_line = go.Figure()
+
+    # Sort categories by descending total and draw them as a single trace
+    sorted_totals_product_line = totals_product_line.sort_values(ascending=False)
+    bar_fig_product_line.add_trace(category_bar_trace(sorted_totals_product_line.index, sorted_totals_product_line.values))
 
     bar_fig_product_line.update_layout(
         title=f'Gross income by product line in {selected_city}',
@@ -226,8 +417,23 @@ def update_charts(contents, selected_product_line, selected_city):
         yaxis_title='Gross income'
     )
 
+    return bar_fig_product_line
+
+# The totals by city do not depend on any dropdown
+@app.callback(
+    Output('bar-chart-city', 'figure'),
+    Input('data-store', 'data'),
+    prevent_initial_call=True
+)
+@memoize()
+def update_city_bar(dataset_key):
+    totals_city = query(supermarket.name, dataset_key, by='City', values='gross income')
+
+    if totals_city is None:
+        raise dash.exceptions.PreventUpdate
+
     # Bar chart for total gross income by City
-    filtered_data_bar_city = data.groupby('City')['gross income'].sum().reset_index()
+    filtered_data_bar_city = totals_city.reset_index()
     bar_fig_city = go.Figure()
 
     # Define custom colors for each city
@@ -247,23 +453,24 @@ def update_charts(contents, selected_product_line, selected_city):
         yaxis_title='Gross income'
     )
 
-    return line_fig, map_fig, bar_fig_product_line, bar_fig_city
+    return bar_fig_city
 
-@app.callback(
-    Output('pie-chart', 'figure'),
-    Input('product-line-dropdown-2', 'value')
-)
-def update_pie_chart(selected_product_line):
-    try:
-        if data is None:
-            raise dash.exceptions.PreventUpdate  # Prevent callback execution if data is None
+# Dashboard 2 callbacks drawn on the server, used when the clientside mode is off
+@memoize()
+def update_pie_chart(dataset_key, selected_product_line):
+    filtered_data = query(supermarket.name, dataset_key, where={'Product line': selected_product_line},
+                          values=['Gender'])
 
-        if 'Gender' not in data.columns:
+    if filtered_data is None:
+        raise dash.exceptions.PreventUpdate  # Prevent callback execution if data is None
+
+    try:
+        if 'Gender' not in filtered_data.columns:
             fig = go.Figure(data=[], layout={})
             return fig
 
-        filtered_data = data[data['Product line'] == selected_product_line]
         gender_counts = filtered_data['Gender'].value_counts()
+        gender_counts = gender_counts[gender_counts > 0]  # Categories absent from this product line
         total_count = gender_counts.sum()
         gender_percentages = {gender: count / total_count * 100 for gender, count in gender_counts.items()}
 
@@ -277,17 +484,16 @@ def update_pie_chart(selected_product_line):
     except Exception as e:
         return go.Figure(data=[], layout={})
 
-@app.callback(
-    Output('payment-count', 'figure'),
-    Input('city-dropdown-2', 'value')
-)
-def update_payment_count(selected_city):
-    try:
-        if data is None:
-            raise dash.exceptions.PreventUpdate  # Prevent callback execution if data is None
+@memoize()
+def update_payment_count(dataset_key, selected_city):
+    filtered_data = query(supermarket.name, dataset_key, where={'City': selected_city}, values=['Payment'])
+
+    if filtered_data is None:
+        raise dash.exceptions.PreventUpdate  # Prevent callback execution if data is None
 
-        filtered_data = data[data['City'] == selected_city]
+    try:
         payment_counts = filtered_data['Payment'].value_counts()
+        payment_counts = payment_counts[payment_counts > 0]  # Categories absent from this city
 
         fig = px.bar(
             x=payment_counts.index,
@@ -300,17 +506,32 @@ def update_payment_count(selected_city):
     except Exception as e:
         return go.Figure(data=[], layout={})
 
-@app.callback(
-    Output('gross-margin-bar', 'figure'),
-    Input('product-line-dropdown-2', 'value'),
-    Input('city-dropdown-2', 'value')
-)
-def update_gross_margin_bar(selected_product_line, selected_city):
+def update_gross_margin_bar(dataset_key, selected_product_line, selected_city, relayout_data):
+    zoom = zoom_request('gross-margin-bar', relayout_data)
+    figure = gross_margin_figure(dataset_key, selected_product_line, selected_city, zoom)
+
+    # A zoom only replaces the bars
+    if zoom:
+        return figure_patch(figure, ['x', 'y'])
+    return figure
+
+@memoize()
+def gross_margin_figure(dataset_key, selected_product_line, selected_city, zoom):
+    # Intersection of the rows of the product line and of the city
+    filtered_data = query(supermarket.name, dataset_key,
+                          where={'Product line': selected_product_line, 'City': selected_city},
+                          values=['Date', 'gross margin'])
+
+    if filtered_data is None:
+        raise dash.exceptions.PreventUpdate  # Prevent callback execution if data is None
+
     try:
-        if data is None:
-            raise dash.exceptions.PreventUpdate  # Prevent callback execution if data is None
 
-        filtered_data = data[(data['Product line'] == selected_product_line) & (data['City'] == selected_city)]
+        # Keep the zoomed range only, then the extremes of each pixel bucket
+        if zoom:
+            start, stop = visible_slice(filtered_data['Date'], zoom)
+            filtered_data = filtered_data.iloc[start:stop]
+        filtered_data = filtered_data.iloc[minmax_indices(filtered_data['gross margin'])]
 
         fig = px.bar(
             x=filtered_data['Date'],
@@ -319,9 +540,104 @@ def update_gross_margin_bar(selected_product_line, selected_city):
             title=f"Gross Margin for {selected_product_line} in {selected_city}"
         )
 
+        fig.update_layout(uirevision=f'{dataset_key}-{selected_product_line}-{selected_city}')
+
         return fig
     except Exception as e:
         return go.Figure(data=[], layout={})
 
+# Nested {outer: {inner: count}} of the rows of each pair of categories
+def nested_counts(dataset_key, outer, inner):
+    sizes = query(supermarket.name, dataset_key, by=[outer, inner], agg='size')
+
+    counts = {}
+    for (outer_value, inner_value), count in sizes.items():
+        counts.setdefault(outer_value, {})[inner_value] = int(count)
+    return counts
+
+# Everything Dashboard 2 draws, pre-aggregated once per dataset: gender counts
+# by product line, payment counts by city and the downsampled gross margin
+# series of every (product line, city)
+@memoize()
+def dashboard2_payload(dataset_key):
+    if not supermarket.contains(dataset_key):
+        raise dash.exceptions.PreventUpdate
+
+    # One (product line, city) at a time, so only its rows are ever read
+    gross_margin = {}
+    for product_line in distinct_values(supermarket.name, 'Product line', dataset_key):
+        for city in distinct_values(supermarket.name, 'City', dataset_key):
+            rows = query(supermarket.name, dataset_key, where={'Product line': product_line, 'City': city},
+                         values=['Date', 'gross margin'])
+            if not len(rows):
+                continue
+            rows = rows.iloc[minmax_indices(rows['gross margin'], buckets=PAYLOAD_BUCKETS)]
+            gross_margin.setdefault(product_line, {})[city] = {
+                'x': np.datetime_as_string(rows['Date'].to_numpy(), unit='auto').tolist(),
+                'y': rows['gross margin'].astype(float).round(4).tolist(),
+            }
+
+    return {
+        'key': dataset_key,
+        'gender': nested_counts(dataset_key, 'Product line', 'Gender'),
+        'payment': nested_counts(dataset_key, 'City', 'Payment'),
+        'gross_margin': gross_margin,
+    }
+
+# Dashboard 2 either redraws in the browser from the payload (assets/dashboard2.js),
+# so changing a dropdown never reaches the server, or on the server per change
+if clientside_dashboard2:
+    app.callback(
+        Output('dashboard2-store', 'data'),
+        Input('data-store', 'data')
+    )(dashboard2_payload)
+
+    app.clientside_callback(
+        ClientsideFunction('dashboard2', 'pie_chart'),
+        Output('pie-chart', 'figure'),
+        Input('dashboard2-store', 'data'),
+        Input('product-line-dropdown-2', 'value')
+    )
+
+    app.clientside_callback(
+        ClientsideFunction('dashboard2', 'payment_count'),
+        Output('payment-count', 'figure'),
+        Input('dashboard2-store', 'data'),
+        Input('city-dropdown-2', 'value')
+    )
+
+    app.clientside_callback(
+        ClientsideFunction('dashboard2', 'gross_margin_bar'),
+        Output('gross-margin-bar', 'figure'),
+        Input('dashboard2-store', 'data'),
+        Input('product-line-dropdown-2', 'value'),
+        Input('city-dropdown-2', 'value')
+    )
+else:
+    app.callback(
+        Output('pie-chart', 'figure'),
+        Input('data-store', 'data'),
+        Input('product-line-dropdown-2', 'value')
+    )(update_pie_chart)
+
+    app.callback(
+        Output('payment-count', 'figure'),
+        Input('data-store', 'data'),
+        Input('city-dropdown-2', 'value')
+    )(update_payment_count)
+
+    app.callback(
+        Output('gross-margin-bar', 'figure'),
+        Input('data-store', 'data'),
+        Input('product-line-dropdown-2', 'value'),
+        Input('city-dropdown-2', 'value'),
+        Input('gross-margin-bar', 'relayoutData')
+    )(update_gross_margin_bar)
+
+# Called by gunicorn.conf.py in the master process when the app is preloaded:
+# the workers it forks then share the imported libraries
+def warm_up():
+    preload(np, pd, go, px)
+
 if __name__ == '__main__':
-    app.run_server(debug=True, port=8051)
+    app.run(debug=True, port=8051)
@@ -0,0 +1,96 @@
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Upper bound of points sent for one series, about one per horizontal pixel
+MAX_POINTS = 2000
+
+
+# x values as floats so distances can be computed (datetimes become ns)
+def _as_numeric(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+# Row positions kept by Largest-Triangle-Three-Buckets, which preserves the
+# visual shape of a line while keeping at most `threshold` points
+def lttb_indices(x, y, threshold=MAX_POINTS):
+    n = len(y)
+    if n <= threshold or threshold < 3:
+        return np.arange(n)
+
+    x = _as_numeric(x)
+    y = np.asarray(y, dtype=float)
+
+    # First and last points are always kept; the rest is split in buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket is the third corner of the triangle
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+# Row positions of the minimum and maximum of each bucket, in order; suited
+# to bars and spiky series where extremes must stay visible
+def minmax_indices(y, buckets=MAX_POINTS // 2):
+    n = len(y)
+    if n <= 2 * buckets:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    bucket = np.arange(n) * buckets // n
+
+    # Sorting by (bucket, y) puts each bucket's minimum first and maximum last
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], n) - 1
+
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+# Positions [start, stop) of the sorted x values inside the range the user
+# zoomed to, read from a graph's relayoutData; the whole series otherwise
+def visible_slice(x, relayout_data, axis='xaxis'):
+    n = len(x)
+    if not relayout_data or relayout_data.get(f'{axis}.autorange'):
+        return 0, n
+
+    bounds = relayout_data.get(f'{axis}.range')
+    if bounds is None:
+        if f'{axis}.range[0]' not in relayout_data:
+            return 0, n
+        bounds = [relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']]
+
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        bounds = [pd.Timestamp(bound).to_datetime64() for bound in bounds]
+
+    start = np.searchsorted(x, min(bounds), side='left')
+    stop = np.searchsorted(x, max(bounds), side='right')
+
+    return int(start), int(stop)
+
+
+# Whether a relayoutData event changed the range of the given axis
+def zoom_changed(relayout_data, axis='xaxis'):
+    return any(key.startswith(f'{axis}.') for key in (relayout_data or {}))
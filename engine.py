@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from instrumentation import stage
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Aggregation engine used by the callbacks: 'pandas' (one thread), 'threads'
+# (row chunks aggregated on a thread pool) or 'processes' (like 'threads',
+# plus a process pool for work on stored partitions)
+ENGINE = os.environ.get('AGGREGATION_ENGINE', 'threads')
+
+# Threads or processes aggregating in parallel, per server worker
+WORKERS = int(os.environ.get('AGGREGATION_WORKERS', os.cpu_count() or 1))
+
+# Rows below which a groupby is not worth splitting
+MIN_CHUNK_ROWS = 250_000
+
+
+def _groupby_sum(frame, keys, columns, dropna):
+    return frame.groupby(keys, observed=True, dropna=dropna)[columns].sum()
+
+
+# Single-threaded pandas, the reference the other engines must agree with
+class PandasEngine:
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+
+    # Run func over items, e.g. one partial aggregate per stored partition
+    def map(self, func, items):
+        return [func(item) for item in items]
+
+    # Sums of columns by keys, indexed by the keys as frame.groupby(...).sum() is
+    def groupby_sum(self, frame, keys, columns, dropna=True):
+        with stage('groupby', len(frame)):
+            return _groupby_sum(frame, keys, columns, dropna)
+
+
+# Splits the rows into one contiguous chunk per thread and merges the partial
+# sums. The chunks are views of the same columns, and pandas releases the GIL
+# in most of its key hashing and summing, so the threads use separate cores.
+#
+# map() and the chunks run on separate pools: a task of map() may itself
+# call groupby_sum() and wait for its chunks, which would never start if
+# every thread of a shared pool were such a task. A forked process (a worker
+# of gunicorn --preload) starts pools of its own: the threads of its parent's
+# pools are not copied into it.
+class ThreadedEngine(PandasEngine):
+    def __init__(self, workers=WORKERS):
+        super().__init__(workers)
+        self._forget_pools()
+        os.register_at_fork(after_in_child=self._forget_pools)
+
+    def _forget_pools(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, name):
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = ThreadPoolExecutor(self.workers, thread_name_prefix=f'aggregate-{name}')
+            return self._pools[name]
+
+    def map(self, func, items):
+        return list(self._pool('map').map(func, items))
+
+    def groupby_sum(self, frame, keys, columns, dropna=True):
+        with stage('groupby', len(frame)):
+            return self._chunked_groupby_sum(frame, keys, columns, dropna)
+
+    def _chunked_groupby_sum(self, frame, keys, columns, dropna):
+        chunks = min(self.workers, len(frame) // MIN_CHUNK_ROWS)
+        if chunks < 2:
+            return _groupby_sum(frame, keys, columns, dropna)
+
+        bounds = np.linspace(0, len(frame), chunks + 1).astype(int)
+        partials = list(self._pool('chunk').map(
+            lambda start, stop: _groupby_sum(frame.iloc[start:stop], keys, columns, dropna),
+            bounds[:-1], bounds[1:]))
+
+        levels = list(range(len(keys))) if isinstance(keys, list) else 0
+        return pd.concat(partials).groupby(level=levels, observed=True, dropna=dropna).sum()
+
+
+# Threads for frames already in memory, plus a pool of processes for map():
+# each process reads its partitions through a memory map, so the columns are
+# shared with the other processes instead of being copied to them
+class ProcessEngine(ThreadedEngine):
+    def __init__(self, workers=WORKERS):
+        super().__init__(workers)
+        self._processes = None
+
+    def _forget_pools(self):
+        super()._forget_pools()
+        self._processes = None
+
+    def map(self, func, items):
+        items = list(items)
+        if len(items) < 2:
+            return [func(item) for item in items]
+
+        # Created on first use; like the thread pools, not shared across a fork
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return list(self._processes.map(func, items))
+
+
+ENGINES = {'pandas': PandasEngine, 'threads': ThreadedEngine, 'processes': ProcessEngine}
+
+_engines = {}
+
+
+def get_engine(name=ENGINE):
+    if name not in _engines:
+        _engines[name] = ENGINES[name]()
+    return _engines[name]
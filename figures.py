@@ -0,0 +1,100 @@
+import dash
+from dash import Patch
+from plotly.colors import qualitative
+
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+go = lazy_import('plotly.graph_objects')
+
+# Marker colors of the cities we know about on the map
+MAP_CITY_COLORS = {'Mandalay': '#E9967A', 'Naypyitaw': '#E9967A', 'Yangon': '#E9967A'}
+MAP_DEFAULT_COLOR = '#63feb9'
+
+# Colors given to categories, in the order plotly assigns them to traces
+CATEGORY_COLORS = qualitative.Plotly
+
+
+# One Scattermapbox trace for every location, with per-point size, color and label
+def map_trace(lat, lon, city, total):
+    total = np.asarray(total, dtype=float)
+    city = np.asarray(city, dtype=object)
+
+    return go.Scattermapbox(
+        lat=np.asarray(lat),
+        lon=np.asarray(lon),
+        mode='markers+text',
+        marker=dict(
+            size=np.maximum(15, total / 200),  # Adjust the size calculation as needed
+            color=[MAP_CITY_COLORS.get(name, MAP_DEFAULT_COLOR) for name in city],
+            opacity=0.7,
+        ),
+        text=[f'{name}: {value}' for name, value in zip(city, total)],  # Label with city name and total
+        hoverinfo='text',
+    )
+
+
+# One bar trace for all categories, colored as if each were its own trace
+def category_bar_trace(categories, values):
+    categories = np.asarray(categories, dtype=object)
+
+    return go.Bar(
+        x=categories,
+        y=np.asarray(values),
+        marker=dict(color=[CATEGORY_COLORS[i % len(CATEGORY_COLORS)] for i in range(len(categories))]),
+    )
+
+
+# Line traces (plain dicts) from per-name (x, y) arrays
+def line_traces(series, names):
+    return [
+        {
+            'x': series[name][0],
+            'y': series[name][1],
+            'type': 'line',
+            'mode': 'lines+markers',
+            'name': name,
+            'text': series[name][1].astype(str),
+            'hoverinfo': 'x+text',
+        } for name in names
+    ]
+
+
+# Whether this callback call was fired by the given inputs ('id.property')
+# alone, so the figure the browser shows keeps its structure
+def triggered_only(*prop_ids):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    return bool(triggered) and all(prop_id in prop_ids for prop_id in triggered)
+
+
+def _lookup(values, path):
+    for part in path.split('.'):
+        values = values[part]
+    return values
+
+
+def _assign(target, path, value):
+    *parents, leaf = path.split('.')
+    for part in parents:
+        target = target[part]
+    target[leaf] = value
+
+
+# Patch that only replaces some properties of a figure the browser already
+# shows: the given trace properties of every trace and the given layout
+# properties, as dotted paths ('marker.color', 'mapbox.center') copied from
+# the full figure
+def figure_patch(figure, trace_properties=(), layout_properties=()):
+    if isinstance(figure, go.Figure):
+        figure = figure.to_plotly_json()
+
+    patch = Patch()
+
+    for number, trace in enumerate(figure['data']):
+        for path in trace_properties:
+            _assign(patch['data'][number], path, _lookup(trace, path))
+
+    for path in layout_properties:
+        _assign(patch['layout'], path, _lookup(figure['layout'], path))
+
+    return patch
@@ -0,0 +1,38 @@
+# gunicorn settings for both dashboards, picked up from the working directory:
+#
+#   gunicorn demo:server
+#   gunicorn --preload prueba_emiliano:server
+#   gunicorn wsgi:server                  (both, under /demo/ and /ventas/)
+#
+# Workers import pandas and plotly on first use, so they answer their first
+# request quickly. With --preload (or GUNICORN_PRELOAD=1) the master instead
+# loads the libraries and the stored data once, before forking, and the
+# workers share those pages copy-on-write.
+#
+# Every worker also calls the app's start_watching(), if it has one, so a
+# watched ingest directory (PRUEBA_WATCH_DIR) is picked up without waiting
+# for a request. The watcher only runs in workers; the aggregation pools the
+# master starts while loading the data are replaced in each worker (see
+# engine.py).
+import os
+import sys
+
+preload_app = os.environ.get('GUNICORN_PRELOAD') == '1'
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker exists
+    if not server.cfg.preload_app:
+        return
+
+    module = sys.modules.get(server.app.app_uri.split(':')[0])
+    warm_up = getattr(module, 'warm_up', None)
+    if warm_up is not None:
+        warm_up()
+
+
+def post_worker_init(worker):
+    module = sys.modules.get(worker.app.app_uri.split(':')[0])
+    start_watching = getattr(module, 'start_watching', None)
+    if start_watching is not None:
+        start_watching()
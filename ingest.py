@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import os
+import tempfile
+
+from datastore import DatasetStore
+from instrumentation import stage
+from jobs import report_progress
+from lazy import lazy_import
+from partitions import PartitionedDataset
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Characters of base64 decoded at a time (a multiple of 4)
+DECODE_CHUNK_CHARS = 8 * 1024 * 1024
+
+# Rows parsed at a time from the decoded CSV
+CSV_CHUNK_ROWS = 50_000
+
+
+# Offset of the base64 payload inside a dcc.Upload data URL
+def _payload_start(contents):
+    return contents.index(',') + 1
+
+
+# Content hash of an upload, computed over the base64 payload a slice at a time
+@stage('decode')
+def upload_digest(contents):
+    digest = hashlib.sha1()
+    for offset in range(_payload_start(contents), len(contents), DECODE_CHUNK_CHARS):
+        digest.update(contents[offset:offset + DECODE_CHUNK_CHARS].encode('ascii'))
+    return digest.hexdigest()
+
+
+# Decode an upload into a temporary file a slice at a time, so neither the
+# whole decoded bytes nor the whole text are ever held in memory
+@stage('decode')
+def upload_to_file(contents, directory=None):
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=directory)
+
+    with os.fdopen(fd, 'wb') as handle:
+        for offset in range(_payload_start(contents), len(contents), DECODE_CHUNK_CHARS):
+            handle.write(base64.b64decode(contents[offset:offset + DECODE_CHUNK_CHARS]))
+
+    return path
+
+
+# Upper bound of the number of records in a CSV file, without parsing it
+def _count_lines(path):
+    lines = 1
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            lines += block.count(b'\n')
+    return lines
+
+
+# Nullable integer types, staged as floats while reading so missing values fit
+NULLABLE_INTS = ('Int8', 'Int16', 'Int32', 'Int64')
+
+
+# Preallocated storage of one column: category codes, or values of its type
+def _empty_column(dtype, capacity):
+    if dtype == 'category':
+        return np.full(capacity, -1, dtype=np.int32)
+    if dtype == 'datetime64[ns]':
+        return np.full(capacity, np.datetime64('NaT'), dtype=dtype)
+    if dtype in NULLABLE_INTS:
+        return np.full(capacity, np.nan, dtype=np.float64)
+    return np.full(capacity, np.nan, dtype=dtype)
+
+
+# Read the given columns of a CSV file in chunks straight into preallocated
+# arrays of their final types. `columns` is a schema from schemas.py mapping
+# each column name to a numpy dtype, a nullable integer type, 'datetime64[ns]'
+# or 'category'; columns missing from the file are left null. Peak memory is
+# the final frame plus one chunk.
+@stage('parse')
+def read_csv_columns(path, columns, progress=None):
+    capacity = _count_lines(path)
+
+    arrays = {name: _empty_column(dtype, capacity) for name, dtype in columns.items()}
+    categories = {name: {} for name, dtype in columns.items() if dtype == 'category'}
+
+    text_columns = {name: str for name, dtype in columns.items() if dtype in ('category', 'datetime64[ns]')}
+    reader = pd.read_csv(path, usecols=lambda name: name in columns, dtype=text_columns, chunksize=CSV_CHUNK_ROWS)
+
+    rows = 0
+    for chunk in reader:
+        end = rows + len(chunk)
+
+        for name in chunk.columns:
+            dtype = columns[name]
+
+            if dtype == 'category':
+                # Map this chunk's values onto codes shared by the whole file
+                codes, uniques = pd.factorize(chunk[name])
+                seen = categories[name]
+                lookup = np.array([seen.setdefault(value, len(seen)) for value in uniques] + [-1], dtype=np.int32)
+                arrays[name][rows:end] = lookup[codes]
+            elif dtype == 'datetime64[ns]':
+                arrays[name][rows:end] = pd.to_datetime(chunk[name]).to_numpy(dtype=dtype)
+            else:
+                values = pd.to_numeric(chunk[name], errors='coerce')
+                arrays[name][rows:end] = values.to_numpy(dtype=arrays[name].dtype, na_value=np.nan)
+
+        rows = end
+        if progress is not None:
+            progress(rows, capacity)
+
+    frame = {}
+    for name, dtype in columns.items():
+        if dtype == 'category':
+            # Sorted categories keep groupby output in the usual alphabetical order
+            values = pd.Categorical.from_codes(arrays[name][:rows], categories=list(categories[name]))
+            frame[name] = values.reorder_categories(sorted(categories[name]))
+        elif dtype in NULLABLE_INTS:
+            frame[name] = pd.array(arrays[name][:rows], dtype=dtype)
+        else:
+            frame[name] = arrays[name][:rows]
+
+    return pd.DataFrame(frame, copy=False)
+
+
+# Decode and parse an upload with a bounded memory footprint
+def read_upload(contents, columns, progress=None):
+    path = upload_to_file(contents)
+    try:
+        return read_csv_columns(path, columns, progress)
+    finally:
+        os.remove(path)
+
+
+# Job: parse a decoded upload and save it in a DatasetStore under `key`.
+# Removes the file when done.
+def store_upload(path, columns, directory, key, sort_by=None):
+    try:
+        frame = read_csv_columns(path, columns, report_progress)
+    finally:
+        os.remove(path)
+
+    if sort_by is not None and not frame[sort_by].is_monotonic_increasing:
+        frame = frame.sort_values(sort_by, ignore_index=True)
+
+    DatasetStore(directory).put(key, frame)
+    return key
+
+
+# Job: parse a decoded upload and append its rows not stored yet (by `key`)
+# as a new partition. A file whose content hash `digest` was appended before
+# is not parsed again. Removes the file when done.
+def append_upload(path, columns, directory, key=None, digest=None):
+    dataset = PartitionedDataset(directory, key)
+
+    try:
+        if digest is not None and dataset.has_upload(digest):
+            return {'rows': 0, 'new': 0, 'duplicates': 0, 'already_loaded': True}
+        frame = read_csv_columns(path, columns, report_progress)
+    finally:
+        os.remove(path)
+
+    return {'rows': len(frame), **dataset.append(frame, digest)}
+
+
+# Concatenate frames keeping categorical columns categorical, even when each
+# frame has its own categories
+def concat_frames(frames):
+    frames = list(frames)
+    if len(frames) == 1:
+        return frames[0]
+
+    union = {}
+    for name, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and all(
+                isinstance(frame.dtypes.get(name), pd.CategoricalDtype) for frame in frames):
+            union[name] = pd.api.types.union_categoricals([frame[name] for frame in frames], sort_categories=True).categories
+
+    if union:
+        frames = [frame.assign(**{name: frame[name].cat.set_categories(categories)
+                                  for name, categories in union.items()}) for frame in frames]
+
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,333 @@
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import flask
+
+from datastore import STORE_DIR, atomic_write
+
+# Directory where every worker process publishes its callback metrics, so
+# /metrics reports the whole server whichever worker answers it
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(STORE_DIR, 'metrics'))
+
+# Minimum seconds between two metric files written by the same worker
+SNAPSHOT_INTERVAL = 1.0
+
+# One JSON line per callback request, to this file or '-' for stderr
+# (unset: no log)
+METRICS_LOG = os.environ.get('METRICS_LOG')
+
+# Callback requests slower than this many seconds leave their sampled stacks
+# in PROFILE_DIR (unset: no profiling)
+PROFILE_SLOW_SECONDS = os.environ.get('PROFILE_SLOW_SECONDS')
+
+# Folded stacks ("frame;frame;frame count" per line), readable by
+# flamegraph.pl, speedscope and similar tools
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(STORE_DIR, 'profiles'))
+
+# Seconds between two stack samples of the requests being served
+PROFILE_INTERVAL = 0.005
+
+# Upper bounds of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stages reported for every callback. decode, parse, cache, filter and
+# groupby are timed where they happen (see stage()); figure is the rest of
+# the callback function, mostly building the figure; serialize is the rest
+# of the request, mostly dash encoding the response as JSON.
+STAGES = ('decode', 'parse', 'cache', 'filter', 'groupby', 'figure', 'serialize')
+
+# Requests being served by this process, by thread
+_active = {}
+
+# Totals by app and callback of this process since it started
+_metrics = {}
+_lock = threading.Lock()
+_snapshot = {'written': 0.0}
+
+_log = logging.getLogger('dash.callbacks')
+_sampler = {'thread': None}
+
+# Held while the sampler adds to a request's samples, so a finished request
+# copies them without the sampler changing them underneath
+_samples_lock = threading.Lock()
+
+
+# Time a block of the current callback under a stage name, and count the
+# dataset rows it reads. Stages are not meant to be nested; outside of a
+# callback request (e.g. in a background job) nothing is recorded.
+@contextmanager
+def stage(name, rows=0):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = _active.get(threading.get_ident())
+        if record is not None:
+            record['stages'][name] = record['stages'].get(name, 0.0) + time.perf_counter() - start
+            record['rows'] += rows
+
+
+# Decorator timing a callback function as a whole (see instrument)
+def _timed_callback(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record = _active.get(threading.get_ident())
+            if record is not None:
+                record['callback_seconds'] += time.perf_counter() - start
+
+    return wrapper
+
+
+# Stage times of a finished request, with figure and serialize derived from
+# what the timed stages leave of the callback and of the whole request
+def _stage_times(record, seconds):
+    stages = dict.fromkeys(STAGES, 0.0)
+    stages.update(record['stages'])
+    stages['figure'] += max(0.0, record['callback_seconds'] - sum(record['stages'].values()))
+    stages['serialize'] += max(0.0, seconds - record['callback_seconds'])
+    return stages
+
+
+# Totals of a callback; buckets are cumulative, as Prometheus histograms are
+def _new_totals():
+    return {'count': 0, 'seconds': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS), 'bytes': 0, 'rows': 0,
+            'stages': dict.fromkeys(STAGES, 0.0)}
+
+
+def _add(totals, other):
+    totals['count'] += other['count']
+    totals['seconds'] += other['seconds']
+    totals['buckets'] = [a + b for a, b in zip(totals['buckets'], other['buckets'])]
+    totals['bytes'] += other['bytes']
+    totals['rows'] += other['rows']
+    for name, seconds in other['stages'].items():
+        totals['stages'][name] = totals['stages'].get(name, 0.0) + seconds
+
+
+def _start_request(app_name):
+    body = flask.request.get_json(silent=True) or {}
+    _active[threading.get_ident()] = {
+        # Outputs shared by two callbacks (allow_duplicate) end in '@<hash>'
+        'app': app_name, 'name': re.sub(r'@\w+', '', body.get('output', 'unknown')), 'start': time.perf_counter(),
+        'callback_seconds': 0.0, 'stages': {}, 'rows': 0, 'samples': Counter(),
+    }
+
+
+def _finish_request(response):
+    record = _active.pop(threading.get_ident(), None)
+    if record is None:
+        return response
+
+    seconds = time.perf_counter() - record['start']
+    size = response.calculate_content_length() or 0
+    stages = _stage_times(record, seconds)
+
+    with _lock:
+        totals = _metrics.setdefault(record['app'], {}).setdefault(record['name'], _new_totals())
+        _add(totals, {'count': 1, 'seconds': seconds, 'bytes': size, 'rows': record['rows'], 'stages': stages,
+                      'buckets': [int(seconds <= bound) for bound in LATENCY_BUCKETS]})
+    _publish()
+
+    profile = None
+    if PROFILE_SLOW_SECONDS is not None and seconds >= float(PROFILE_SLOW_SECONDS):
+        # The sampler may still hold the record it read before the pop above
+        with _samples_lock:
+            samples = dict(record['samples'])
+        if samples:
+            profile = _write_profile(record['name'], samples)
+
+    if METRICS_LOG:
+        _log.info(json.dumps({
+            'time': time.time(), 'pid': os.getpid(), 'app': record['app'], 'callback': record['name'],
+            'status': response.status_code, 'seconds': round(seconds, 6),
+            'stages': {name: round(value, 6) for name, value in stages.items()}, 'bytes': size, 'rows': record['rows'], 'profile': profile,
+        }))
+
+    return response
+
+
+# Drop the record of a request that ended without a response (debug mode
+# re-raises callback errors past after_request)
+def _abandon_request(error=None):
+    _active.pop(threading.get_ident(), None)
+
+
+# Write this worker's totals where the other workers' /metrics can read them
+def _publish(force=False):
+    now = time.monotonic()
+    if not force and now - _snapshot['written'] < SNAPSHOT_INTERVAL:
+        return
+    _snapshot['written'] = now
+
+    with _lock:
+        snapshot = json.dumps(_metrics)
+
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with atomic_write(os.path.join(METRICS_DIR, f'{os.getpid()}.json')) as handle:
+        handle.write(snapshot)
+
+
+# Totals by app and callback of every worker that has published some, this
+# one included
+def collect():
+    _publish(force=True)
+
+    merged = {}
+    for entry in os.scandir(METRICS_DIR):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path) as handle:
+                metrics = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            continue
+        for app_name, callbacks in metrics.items():
+            for name, totals in callbacks.items():
+                _add(merged.setdefault(app_name, {}).setdefault(name, _new_totals()), totals)
+
+    return merged
+
+
+# (labels, totals) of every callback in metrics, sorted
+def _series(metrics):
+    for app_name, callbacks in sorted(metrics.items()):
+        for name, totals in sorted(callbacks.items()):
+            yield f'app="{_label(app_name)}",callback="{_label(name)}"', totals
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Prometheus text exposition of collect()
+def prometheus_text(metrics):
+    lines = [
+        '# HELP dash_callback_seconds Seconds to answer a callback request',
+        '# TYPE dash_callback_seconds histogram',
+    ]
+    for labels, totals in _series(metrics):
+        for bound, count in zip(LATENCY_BUCKETS, totals['buckets']):
+            lines.append(f'dash_callback_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'dash_callback_seconds_bucket{{{labels},le="+Inf"}} {totals["count"]}')
+        lines.append(f'dash_callback_seconds_sum{{{labels}}} {totals["seconds"]}')
+        lines.append(f'dash_callback_seconds_count{{{labels}}} {totals["count"]}')
+
+    lines += [
+        '# HELP dash_callback_stage_seconds_total Seconds spent in each stage of a callback',
+        '# TYPE dash_callback_stage_seconds_total counter',
+    ]
+    for labels, totals in _series(metrics):
+        for stage_name, seconds in totals['stages'].items():
+            lines.append(f'dash_callback_stage_seconds_total{{{labels},stage="{stage_name}"}} {seconds}')
+
+    lines += [
+        '# HELP dash_callback_response_bytes_total Bytes of callback responses',
+        '# TYPE dash_callback_response_bytes_total counter',
+    ]
+    for labels, totals in _series(metrics):
+        lines.append(f'dash_callback_response_bytes_total{{{labels}}} {totals["bytes"]}')
+
+    lines += [
+        '# HELP dash_callback_rows_total Dataset rows read by callbacks',
+        '# TYPE dash_callback_rows_total counter',
+    ]
+    for labels, totals in _series(metrics):
+        lines.append(f'dash_callback_rows_total{{{labels}}} {totals["rows"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _metrics_view():
+    # Local endpoint: scrapers run next to the server, browsers do not see it
+    if flask.request.remote_addr not in ('127.0.0.1', '::1'):
+        flask.abort(404)
+    return flask.Response(prometheus_text(collect()), mimetype='text/plain; version=0.0.4')
+
+
+# "file:function" frames of a stack, outermost first
+def _folded(frame):
+    names = []
+    while frame is not None:
+        names.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+# Sample the stacks of the threads serving callbacks, for as long as the
+# process lives; a request keeps its samples until it ends
+def _sample():
+    while True:
+        time.sleep(PROFILE_INTERVAL)
+        frames = sys._current_frames()
+        for thread_id, record in list(_active.items()):
+            frame = frames.get(thread_id)
+            if frame is not None:
+                stack = _folded(frame)
+                with _samples_lock:
+                    record['samples'][stack] += 1
+
+
+def _write_profile(callback_name, samples):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r'[^\w.-]+', '_', callback_name).strip('_')[:80]
+    path = os.path.join(PROFILE_DIR, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.folded')
+    with open(path, 'w') as handle:
+        for stack, count in samples.items():
+            handle.write(f'{stack} {count}\n')
+    return path
+
+
+def _start_sampler():
+    if PROFILE_SLOW_SECONDS is None or _sampler['thread'] is not None:
+        return
+    _sampler['thread'] = threading.Thread(target=_sample, name='callback-profiler', daemon=True)
+    _sampler['thread'].start()
+
+
+# Time every callback of app registered after this call, and serve the
+# totals of all workers at /metrics, labelled with the app's name so apps
+# mounted on one server (see wsgi.py) keep their callbacks apart. Each request records its latency,
+# stage times, response bytes and dataset rows read; see METRICS_LOG and
+# PROFILE_SLOW_SECONDS for the log and the profiler.
+def instrument(app):
+    callback = app.callback
+
+    @functools.wraps(callback)
+    def timed_callback(*args, **kwargs):
+        register = callback(*args, **kwargs)
+        return lambda func: register(_timed_callback(func))
+
+    app.callback = timed_callback
+
+    dispatch_path = f'{app.config.routes_pathname_prefix}_dash-update-component'
+
+    @app.server.before_request
+    def start_request():
+        if flask.request.path == dispatch_path:
+            _start_sampler()
+            _start_request(app.config.name)
+
+    app.server.after_request(_finish_request)
+    app.server.teardown_request(_abandon_request)
+    app.server.add_url_rule('/metrics', 'metrics', _metrics_view)
+
+    if METRICS_LOG and not _log.handlers:
+        handler = logging.StreamHandler(sys.stderr) if METRICS_LOG == '-' else logging.FileHandler(METRICS_LOG)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _log.addHandler(handler)
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+
+    return app
@@ -0,0 +1,136 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from datastore import STORE_DIR, atomic_write
+
+# Directory holding one status file per job, readable from every worker
+JOBS_DIR = os.environ.get('INGEST_JOBS_DIR', os.path.join(STORE_DIR, 'jobs'))
+
+# Processes parsing uploads in the background, per server worker
+MAX_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+
+# Seconds a finished job's status is kept
+STATUS_TTL = 24 * 60 * 60
+
+# Minimum seconds between two progress writes of a running job
+PROGRESS_INTERVAL = 0.25
+
+# Job being run by this process, set inside pool workers only
+_current = {'directory': None, 'job_id': None, 'written': 0.0}
+
+
+def _status_path(directory, job_id):
+    return os.path.join(directory, f'{job_id}.json')
+
+
+def _write_status(directory, job_id, status):
+    with atomic_write(_status_path(directory, job_id)) as handle:
+        json.dump(status, handle)
+
+
+# Called by a running task to publish how far it got
+def report_progress(done, total):
+    if _current['job_id'] is None:
+        return
+
+    now = time.monotonic()
+    if now - _current['written'] < PROGRESS_INTERVAL:
+        return
+
+    _current['written'] = now
+    _write_status(_current['directory'], _current['job_id'],
+                  {'state': 'running', 'progress': min(done / total, 1.0) if total else 0.0})
+
+
+def _run(directory, job_id, func, args):
+    _current.update(directory=directory, job_id=job_id, written=0.0)
+    _write_status(directory, job_id, {'state': 'running', 'progress': 0.0})
+
+    try:
+        result = func(*args)
+    except Exception as error:
+        _write_status(directory, job_id, {'state': 'error', 'error': str(error)})
+    else:
+        _write_status(directory, job_id, {'state': 'done', 'progress': 1.0, 'result': result})
+    finally:
+        _current.update(directory=None, job_id=None)
+
+
+# Queue of background jobs run in a local process pool. The request thread
+# only submits work; progress and results go through status files, so any
+# worker of the server can answer the browser's polling.
+#
+# A job whose process dies (e.g. killed for running out of memory) ends in
+# the error state, as do the jobs queued with it; the broken pool is
+# replaced by a new one for the next submit.
+class JobQueue:
+    def __init__(self, directory=JOBS_DIR, max_workers=MAX_WORKERS):
+        self.directory = directory
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _pool(self):
+        # Created on first use, after the server has forked its workers. Pool
+        # processes are spawned so they never inherit locks held by threads.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _drop_pool(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def submit(self, func, *args):
+        self._cleanup()
+
+        job_id = uuid.uuid4().hex
+        _write_status(self.directory, job_id, {'state': 'queued', 'progress': 0.0})
+
+        executor = self._pool()
+        try:
+            future = executor.submit(_run, self.directory, job_id, func, args)
+        except BrokenProcessPool:
+            # Broke before its failed jobs were noticed
+            self._drop_pool(executor)
+            executor = self._pool()
+            future = executor.submit(_run, self.directory, job_id, func, args)
+        future.add_done_callback(partial(self._finished, executor, job_id))
+
+        return job_id
+
+    # Errors _run could not write itself: the pool failed to run the job
+    def _finished(self, executor, job_id, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            _write_status(self.directory, job_id, {'state': 'error', 'error': str(error or 'cancelled')})
+        if isinstance(error, BrokenProcessPool):
+            self._drop_pool(executor)
+
+    def status(self, job_id):
+        try:
+            with open(_status_path(self.directory, job_id)) as handle:
+                return json.load(handle)
+        except (FileNotFoundError, TypeError):
+            return {'state': 'error', 'error': 'unknown job'}
+
+    def _cleanup(self):
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if now - entry.stat().st_mtime > STATUS_TTL:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,55 @@
+import importlib
+import threading
+import types
+
+import flask
+
+# Heavy libraries (pandas, plotly.express, pyarrow) are imported on first use
+# rather than when a dashboard module is imported, so a server worker starts
+# answering requests before it has paid for them.
+
+# Held while a lazy module is imported, so one thread imports and the others
+# wait for it rather than meet the module half initialized in sys.modules
+_import_lock = threading.RLock()
+
+
+# Module imported the first time one of its attributes is read
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+
+    def _load(self):
+        with _import_lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+            self.__dict__['_lazy_loaded'] = True
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+# Import lazy modules right away, e.g. in a gunicorn master started with
+# --preload so the workers it forks share them
+def preload(*modules):
+    for module in modules:
+        if isinstance(module, LazyModule) and not module.__dict__.get('_lazy_loaded'):
+            module._load()
+
+
+# Import modules before the first callback of app runs in this process.
+# Callbacks reach pandas through other libraries too (plotly, unpickled
+# results), which would see it half imported while another request thread
+# is still importing it; callback requests arriving meanwhile wait for it.
+# The page and the layout are still served without the modules.
+def preload_before_callbacks(app, *modules):
+    dispatch_path = f'{app.config.routes_pathname_prefix}_dash-update-component'
+
+    @app.server.before_request
+    def preload_modules():
+        if flask.request.path == dispatch_path:
+            preload(*modules)
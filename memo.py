@@ -0,0 +1,160 @@
+import functools
+import hashlib
+import os
+import pickle
+import stat
+import threading
+from collections import OrderedDict
+
+import dash
+
+from datastore import STORE_DIR, atomic_write
+from instrumentation import stage
+
+# Directory of memoized results shared by every worker process
+MEMO_DIR = os.environ.get('MEMO_DIR', os.path.join(STORE_DIR, 'memo'))
+
+# Results kept in memory by each worker
+MEMORY_ENTRIES = int(os.environ.get('MEMO_MEMORY_ENTRIES', 256))
+
+# Results kept on disk across all workers
+DISK_ENTRIES = int(os.environ.get('MEMO_DISK_ENTRIES', 4096))
+
+# Disk writes between two evictions of the oldest results
+EVICT_EVERY = 64
+
+_MISSING = object()
+
+
+# Hash of the application's modules, part of every key so that results drawn
+# by the code (or schemas) of an earlier deploy are never served by this one.
+# MEMO_CODE_VERSION can name the release instead.
+def _code_version():
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(app_dir)):
+        if name.endswith('.py'):
+            with open(os.path.join(app_dir, name), 'rb') as handle:
+                digest.update(name.encode())
+                digest.update(handle.read())
+    return digest.hexdigest()
+
+
+CODE_VERSION = os.environ.get('MEMO_CODE_VERSION') or _code_version()
+
+
+# Results are unpickled, which runs whatever code the writer of a file chose,
+# so the directory must be one no other user can write to: created for this
+# user only, owned by it, and inside directories that belong to it or to root
+# and that others cannot rename it out of (sticky ones such as /tmp are fine)
+def _check_private(directory):
+    path = os.path.abspath(directory)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise PermissionError(f'{path} belongs to or is writable by another user; set MEMO_DIR to a private directory')
+
+    while path != os.path.dirname(path):
+        path = os.path.dirname(path)
+        info = os.stat(path)
+        if info.st_uid not in (os.getuid(), 0) or (info.st_mode & 0o022 and not info.st_mode & stat.S_ISVTX):
+            raise PermissionError(f'{path} belongs to or is writable by another user; set MEMO_DIR to a private directory')
+
+
+# Two-level LRU of callback results: a small one in this process in front of
+# pickled files shared with the other workers
+class ResultCache:
+    def __init__(self, directory=MEMO_DIR, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        _check_private(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pickle')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as handle:
+                value = pickle.load(handle)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+
+        with atomic_write(self._path(key), 'wb') as handle:
+            pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pickle'):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.disk_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.memory_entries:
+                self._entries.popitem(last=False)
+
+
+result_cache = ResultCache()
+
+
+# Memoize a callback on its arguments plus the versions of the data it reads
+# and of the code (CODE_VERSION). `version` is called on every invocation and
+# must be cheap; leave it out when an argument already identifies the data
+# (such as a content hash). Results of dash.no_update and raised exceptions
+# are never cached.
+def memoize(version=None, cache=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            results = cache or result_cache
+            identity = (CODE_VERSION, func.__module__, func.__qualname__, args, version() if version else None)
+            key = hashlib.sha1(pickle.dumps(identity)).hexdigest()
+
+            with stage('cache'):
+                value = results.get(key)
+            if value is _MISSING:
+                value = func(*args)
+                if value is not dash.no_update:
+                    results.set(key, value)
+
+            return value
+
+        return wrapper
+
+    return decorator
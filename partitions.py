@@ -0,0 +1,174 @@
+import json
+import os
+
+from datastore import atomic_write, default_index, file_lock
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+feather = lazy_import('pyarrow.feather')
+
+MANIFEST = 'manifest.json'
+
+
+# 64-bit hash of the key columns of every row, equal for equal values
+# whatever the categories of each frame
+def key_hashes(frame, key):
+    return pd.util.hash_pandas_object(frame[key], index=False).to_numpy()
+
+
+# Key columns frame does not have, or has no value in at all: read through a
+# schema, a column missing from the uploaded file is all nulls
+def missing_key_columns(frame, key):
+    return [column for column in key if column not in frame.columns or frame[column].isna().all()]
+
+
+# Append-only dataset on disk: every ingest becomes a new Feather partition
+# and manifest.json lists the partitions in the order they were written.
+# Stored partitions are never rewritten when appending.
+#
+# With a `key` (a list of columns), rows whose key is already stored are
+# dropped on append. Each partition then gets a sorted file of the hashes of
+# its keys next to it, so new rows are checked with binary searches over
+# memory-mapped hashes instead of a scan of the stored rows. Nulls in a key
+# column are compared as values, but the rows of a file missing a key column
+# (e.g. without a Name column) have no key: they are always stored, never
+# counted as duplicates.
+class PartitionedDataset:
+    def __init__(self, directory, key=None):
+        self.directory = directory
+        self.key = key
+        self.manifest_path = os.path.join(directory, MANIFEST)
+
+        os.makedirs(directory, exist_ok=True)
+
+    # Version of the stored data, None before the first write: changes with
+    # every manifest write, even within the timestamp resolution of the file
+    # system, as each write replaces the manifest with a new file (a new
+    # inode) that is larger than the last one
+    def manifest_version(self):
+        try:
+            info = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return f'{info.st_ino}-{info.st_mtime_ns}-{info.st_size}'
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return {'version': 0, 'partitions': []}
+
+    # Whether a file with this content hash was appended already
+    def has_upload(self, digest):
+        return digest in self.read_manifest().get('uploads', [])
+
+    # Store the rows of frame not stored yet. `digest`, the content hash of
+    # the uploaded file, is remembered so the same file is skipped next time.
+    # Returns the number of new and of duplicate rows, and whether the whole
+    # file had been appended already.
+    def append(self, frame, digest=None):
+        rows = len(frame)
+
+        with file_lock(os.path.join(self.directory, '.lock')):
+            manifest = self.read_manifest()
+            uploads = manifest.setdefault('uploads', [])
+
+            if digest is not None and digest in uploads:
+                return {'new': 0, 'duplicates': rows, 'already_loaded': True}
+
+            backfilled = False
+            hashes = None
+            if self.key:
+                backfilled = self._backfill_keys(manifest, frame.dtypes)
+                hashes = np.empty(0, dtype=np.uint64)
+
+                # Only the first row of each key, and only keys not stored yet
+                if not missing_key_columns(frame, self.key):
+                    hashes = key_hashes(frame, self.key)
+                    _, first = np.unique(hashes, return_index=True)
+                    fresh = np.zeros(len(frame), dtype=bool)
+                    fresh[first] = True
+                    fresh &= ~self._stored_keys(manifest, hashes)
+
+                    if not fresh.all():
+                        frame = frame[fresh]
+                        hashes = hashes[fresh]
+
+            if len(frame):
+                number = len(manifest['partitions'])
+                entry = {'file': f'part-{number:06d}.feather', 'rows': len(frame)}
+                feather.write_feather(default_index(frame), os.path.join(self.directory, entry['file']),
+                                      compression='uncompressed')
+
+                if hashes is not None:
+                    entry['keys'] = f'part-{number:06d}.keys.npy'
+                    np.save(os.path.join(self.directory, entry['keys']), np.sort(hashes))
+
+                manifest['partitions'].append(entry)
+
+            if digest is not None:
+                uploads.append(digest)
+
+            # Nothing to record when neither rows nor a file hash were added
+            if len(frame) or digest is not None or backfilled:
+                manifest['version'] += 1
+                self._write_manifest(manifest)
+
+        return {'new': len(frame), 'duplicates': rows - len(frame), 'already_loaded': False}
+
+    def partition_path(self, entry):
+        return os.path.join(self.directory, entry['file'])
+
+    # Rows of a partition read through a memory map; with `columns`, only
+    # those of them the partition has
+    def read_partition(self, entry, columns=None):
+        table = feather.read_table(self.partition_path(entry), memory_map=True)
+        if columns is not None:
+            table = table.select([name for name in columns if name in table.column_names])
+        return table.to_pandas()
+
+    # Write the hash file of every partition stored without one, e.g. before
+    # rows had a key, with the key columns cast to the types of new rows
+    # (`dtypes`) so equal keys hash alike. Called with the lock held; returns
+    # whether the manifest changed.
+    def _backfill_keys(self, manifest, dtypes):
+        changed = False
+        for entry in manifest['partitions']:
+            if 'keys' in entry:
+                continue
+
+            stored = self.read_partition(entry, self.key)
+            hashes = np.empty(0, dtype=np.uint64)
+            if not missing_key_columns(stored, self.key):
+                for column in self.key:
+                    if column in dtypes and not isinstance(dtypes[column], pd.CategoricalDtype):
+                        stored[column] = stored[column].astype(dtypes[column])
+                hashes = key_hashes(stored, self.key)
+
+            entry['keys'] = entry['file'].replace('.feather', '.keys.npy')
+            np.save(os.path.join(self.directory, entry['keys']), np.sort(hashes))
+            changed = True
+        return changed
+
+    # Which of the hashes belong to rows already stored
+    def _stored_keys(self, manifest, hashes):
+        stored = np.zeros(len(hashes), dtype=bool)
+
+        for entry in manifest['partitions']:
+            if 'keys' not in entry:
+                continue
+
+            index = np.load(os.path.join(self.directory, entry['keys']), mmap_mode='r')
+            if not len(index):
+                continue
+
+            positions = np.minimum(np.searchsorted(index, hashes), len(index) - 1)
+            stored |= index[positions] == hashes
+
+        return stored
+
+    def _write_manifest(self, manifest):
+        with atomic_write(self.manifest_path) as handle:
+            json.dump(manifest, handle)
@@ -1,26 +1,127 @@
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
-import pandas as pd
-import plotly.graph_objects as go
-import base64
-import io
+from dash.dependencies import Input, Output, State
 import os
-
-# Inicia la aplicación Dash con el nombre 'prueba'
-app = dash.Dash(__name__)
+import threading
+from functools import partial
+from aggregates import build_genre_index, genre_series_until, merge_cube, merge_cubes, partition_cube
+from datasets import distinct_values, get_dataset, ingest_file
+from engine import get_engine
+from figures import figure_patch, line_traces, triggered_only
+from ingest import read_csv_columns, upload_digest, upload_to_file
+from instrumentation import instrument, stage
+from jobs import JobQueue
+from lazy import lazy_import, preload, preload_before_callbacks
+from memo import memoize
+from schemas import enforce_schema
+from watcher import DirectoryWatcher, file_digest
+
+# Se importan al usarlos por primera vez, no al arrancar cada worker
+pd = lazy_import('pandas')
+go = lazy_import('plotly.graph_objects')
+
+# Inicia la aplicación Dash con el nombre 'prueba'; con PRUEBA_URL_PREFIX se
+# sirve bajo una ruta, como hace wsgi.py al montar los dos tableros juntos.
+# Las respuestas van comprimidas (Flask-Compress) si el navegador lo acepta.
+app = dash.Dash(__name__, requests_pathname_prefix=os.environ.get('PRUEBA_URL_PREFIX', '/'), compress=True)
+
+# Tiempos por etapa, tamaño de las respuestas y filas leídas de cada callback, en /metrics
+instrument(app)
+
+# La primera petición de un callback en cada worker importa las librerías; las demás la esperan
+preload_before_callbacks(app, pd, go)
 
 server=app.server
 
-# Nombre del archivo CSV para almacenar los datos
+# Historial de ventas registrado en datasets.py: particiones que solo se
+# añaden, nunca se reescriben. Las filas con un Name, Platform y Year ya
+# guardados no se vuelven a añadir.
+video_games = get_dataset('video_game_sales')
+history = video_games.partitions
+data_dir = video_games.directory
+
+# Columnas que usan los gráficos y tipos con los que se cargan
+upload_columns = video_games.schema
+
+# Nombre del archivo CSV usado por versiones anteriores
 csv_filename = 'data.csv'
 
-# Verifica si el archivo CSV ya existe, si no, crea uno vacío
-if not os.path.exists(csv_filename):
-    pd.DataFrame(columns=['Global_Sales', 'Platform']).to_csv(csv_filename, index=False)
+# Los archivos subidos se procesan en segundo plano, fuera del hilo de la petición
+ingest_jobs = JobQueue()
+
+# Carpeta donde el ETL nocturno deja archivos CSV nuevos. Si se define, un
+# worker a la vez la vigila y carga cada archivo nuevo sin que nadie lo suba.
+watch_dir = os.environ.get('PRUEBA_WATCH_DIR')
+watcher = DirectoryWatcher(video_games.name, watch_dir, ingest_jobs) if watch_dir else None
+
+# Milisegundos entre dos consultas de la versión de los datos desde el navegador
+VERSION_POLL_MS = 5000
+
+# Motor de agregación (ver engine.py): reparte las sumas entre varios núcleos
+aggregation = get_engine()
+
+# Particiones ya sumadas al cubo de este worker y versión del manifiesto.
+# Se leen en el primer uso, no al importar el módulo.
+loaded_partitions = 0
+manifest_version = None
+
+# Un solo hilo a la vez lee las particiones nuevas, para no sumarlas dos veces al cubo
+refresh_lock = threading.Lock()
+
+# Cubo con las ventas sumadas por año, género y plataforma
+sales_cube = None
+
+# Series de ventas globales por género, ordenadas por año
+genre_index = {}
+
+# Carga solo las particiones nuevas y las suma al cubo de ventas
+def refresh_data():
+    with refresh_lock:
+        _refresh_data()
+
+def _refresh_data():
+    global sales_cube, genre_index, loaded_partitions, manifest_version
+
+    version = history.manifest_version()
 
-# Variable global para almacenar los datos del CSV
-global_data = pd.read_csv(csv_filename)  # Cargar los datos iniciales desde el archivo CSV
+    # Importa una única vez el CSV antiguo como primera partición. Su hash
+    # queda en el manifiesto, y append() lo comprueba bajo el bloqueo de las
+    # particiones, así dos workers que arrancan a la vez no lo importan dos veces.
+    if version is None and os.path.exists(csv_filename):
+        history.append(read_csv_columns(csv_filename, upload_columns), file_digest(csv_filename))
+        version = history.manifest_version()
+
+    if version == manifest_version and sales_cube is not None:
+        return
+
+    partitions = history.read_manifest()['partitions']
+    new_entries = partitions[loaded_partitions:]
+
+    # El cubo de cada partición nueva se calcula en paralelo y se suma al existente
+    partial_cubes = aggregation.map(partial(partition_cube, history, upload_columns), new_entries)
+    sales_cube = merge_cubes([sales_cube] + partial_cubes)
+    if sales_cube is None:
+        sales_cube = merge_cube(None, enforce_schema(pd.DataFrame(), upload_columns))
+    if new_entries:
+        genre_index = build_genre_index(sales_cube)
+
+    loaded_partitions = len(partitions)
+    manifest_version = version
+
+# Versión de los datos guardados: cambia con cada partición nueva y sirve
+# para invalidar los gráficos memorizados
+def data_version():
+    return video_games.version()
+
+# Devuelve el cubo de ventas al día con las particiones guardadas
+def get_sales_cube():
+    refresh_data()
+    return sales_cube
+
+# Devuelve las series por género al día con las particiones guardadas
+def get_genre_index():
+    refresh_data()
+    return genre_index
 
 # Nuevos colores personalizados
 colors = ['#FFFC8D', '#FFC489', '#FFA99F', '#E2E2E2', '#DCDCDC']
@@ -28,31 +129,53 @@ colors = ['#FFFC8D', '#FFC489', '#FFA99F', '#E2E2E2', '#DCDCDC']
 # Rango de años deseado
 year_range = list(range(1980, 2021))
 
-# Opciones de género
-Genre = ['Action', 'Adventure', 'Role-Playing', 'Sports', 'Shooter', 'Simulation', 'Strategy', 'Puzzle', 'Misc']
-
-# Diseño del layout
-app.layout = html.Div([
-    dcc.Tabs(id='tabs', value='tab2', children=[
-        dcc.Tab(label='Ventas 💹', value='tab2'),
-        dcc.Tab(label='Presupuesto 💰', value='tab1'),
-        dcc.Tab(label='Finanzas 💹', value='tab3'),
-        dcc.Tab(label='Crédito 💹', value='tab4')
-    ]),
-    html.Div(id='tabs-content')
-])
+# Diseño del layout; se genera en cada carga de la página para que la
+# versión guardada sea la de los datos que se muestran
+def serve_layout():
+    return html.Div([
+        dcc.Store(id='data-version', data=str(data_version())),
+        dcc.Interval(id='data-poll', interval=VERSION_POLL_MS),
+        dcc.Tabs(id='tabs', value='tab2', children=[
+            dcc.Tab(label='Ventas 💹', value='tab2'),
+            dcc.Tab(label='Presupuesto 💰', value='tab1'),
+            dcc.Tab(label='Finanzas 💹', value='tab3'),
+            dcc.Tab(label='Crédito 💹', value='tab4')
+        ]),
+        html.Div(id='tabs-content')
+    ])
+
+app.layout = serve_layout
+
+# Consulta barata de la versión de los datos (una lectura del manifiesto).
+# Solo cuando cambia se actualiza data-version, y con ella los gráficos
+# visibles, que envían únicamente sus datos nuevos.
+@app.callback(Output('data-version', 'data'),
+              [Input('data-poll', 'n_intervals')],
+              [State('data-version', 'data')],
+              prevent_initial_call=True)
+def poll_data_version(n_intervals, shown_version):
+    version = str(data_version())
+    if version == shown_version:
+        raise dash.exceptions.PreventUpdate
+    return version
 
 # Callback para cambiar entre las pestañas
 @app.callback(Output('tabs-content', 'children'),
               [Input('tabs', 'value')])
+@memoize(data_version)
 def render_content(tab):
+    # Importa el CSV antiguo si hace falta; las opciones salen del índice de filas
+    refresh_data()
+
     if tab == 'tab1':
+        platforms = distinct_values(video_games.name, 'Platform')
+
         return html.Div([
             dcc.Graph(id='sales-graph'),
             dcc.Dropdown(
                 id='platform-dropdown',
-                options=[{'label': str(platform), 'value': str(platform)} for platform in global_data['Platform'].unique()],
-                value=global_data['Platform'].unique()[0],  # Valor predeterminado seleccionado
+                options=[{'label': str(platform), 'value': str(platform)} for platform in platforms],
+                value=platforms[0] if platforms else None,  # Valor predeterminado seleccionado
                 style={'width': '150px'}  # Establece el ancho del menú desplegable
             )
         ])
@@ -67,6 +190,8 @@ def render_content(tab):
                 multiple=False
             ),
             html.Div(id='output-data-upload'),
+            dcc.Store(id='ingest-job'),
+            dcc.Interval(id='ingest-poll', interval=500, disabled=True),
             dcc.Graph(id='line-chart')
         ])
     elif tab == 'tab3':
@@ -95,6 +220,9 @@ def render_content(tab):
             )
         ])
     elif tab == 'tab4':
+        # Opciones de género a partir de los datos cargados
+        genres = distinct_values(video_games.name, 'Genre')
+
         return html.Div([
             dcc.Graph(id='time-series-chart'),
             dcc.Slider(
@@ -108,8 +236,8 @@ def render_content(tab):
             html.Div([
                 dcc.Checklist(
                     id='genre-checklist-ts',
-                    options=[{'label': genre, 'value': genre} for genre in Genre],
-                    value=Genre,  # Puedes establecer un valor predeterminado aquí si lo deseas
+                    options=[{'label': genre, 'value': genre} for genre in genres],
+                    value=genres,  # Puedes establecer un valor predeterminado aquí si lo deseas
                     inline=True,
                     style={'width': '200px'}
                 ),
@@ -118,8 +246,18 @@ def render_content(tab):
 
 # Callback para actualizar el gráfico de semi círculo (gauge)
 @app.callback(Output('sales-graph', 'figure'),
-              [Input('platform-dropdown', 'value')])
-def update_gauge_chart(selected_platform):
+              [Input('platform-dropdown', 'value'),
+               Input('data-version', 'data')])
+def update_gauge_chart(selected_platform, version):
+    fig = gauge_figure(selected_platform)
+
+    # Con datos nuevos solo cambia el valor del indicador
+    if triggered_only('data-version.data'):
+        return figure_patch(fig, ['value'])
+    return fig
+
+@memoize(data_version)
+def gauge_figure(selected_platform):
     # Utiliza la función load_data() para obtener los datos filtrados
     df = load_data(selected_platform)
 
@@ -152,28 +290,79 @@ def update_gauge_chart(selected_platform):
     else:
         return go.Figure()
 
-# Función para cargar los datos directamente desde el DataFrame global
+# Función para cargar los datos de una plataforma desde el cubo de ventas
 def load_data(selected_platform):
-    global global_data
+    sales_cube = get_sales_cube()
 
-    # Filtra los datos para incluir solo juegos de la plataforma seleccionada
-    df_filtered = global_data[global_data['Platform'] == selected_platform]
+    # Filtra las celdas del cubo de la plataforma seleccionada
+    with stage('filter', len(sales_cube)):
+        df_filtered = sales_cube[sales_cube['Platform'] == selected_platform]
 
     return df_filtered
 
-# Callback para cargar el archivo CSV y actualizar el gráfico de línea
-@app.callback(Output('line-chart', 'figure'),
-              [Input('upload-data', 'contents'),
-               Input('upload-data', 'filename')])
-def update_graph(contents, filename):
-    global global_data
-
+# Callback para cargar el archivo CSV en segundo plano. El contenido se
+# borra en cuanto se encola el trabajo, así las consultas del progreso no
+# vuelven a enviar el archivo.
+@app.callback([Output('output-data-upload', 'children'),
+               Output('ingest-job', 'data'),
+               Output('ingest-poll', 'disabled'),
+               Output('upload-data', 'contents')],
+              Input('upload-data', 'contents'),
+              State('upload-data', 'filename'),
+              prevent_initial_call=True)
+def submit_upload(contents, filename):
     if contents is None:
-        return dash.no_update
-
-    df_grouped = parse_contents(contents, filename)
-
-    # Crea el gráfico de línea
+        raise dash.exceptions.PreventUpdate
+
+    # El mismo archivo subido otra vez no se decodifica ni se procesa
+    digest = upload_digest(contents)
+    if video_games.contains(digest):
+        return ingest_summary(filename, {'already_loaded': True}), None, True, None
+
+    # En la petición solo se decodifica el archivo; el resto lo hace un proceso aparte
+    job_id = ingest_jobs.submit(ingest_file, video_games.name, upload_to_file(contents), digest)
+    return f'Cargando {filename}: 0%', {'id': job_id, 'filename': filename}, False, None
+
+# Redibuja el gráfico de línea con los datos nuevos cargados por otra sesión
+# o desde la carpeta vigilada
+@app.callback(Output('line-chart', 'figure', allow_duplicate=True),
+              Input('data-version', 'data'),
+              prevent_initial_call=True)
+def refresh_line_chart(version):
+    return line_chart_figure(yearly_sales())
+
+# Callback que consulta el progreso del trabajo y actualiza el gráfico de
+# línea cuando los datos están guardados
+@app.callback([Output('line-chart', 'figure', allow_duplicate=True),
+               Output('output-data-upload', 'children', allow_duplicate=True),
+               Output('ingest-job', 'data', allow_duplicate=True),
+               Output('ingest-poll', 'disabled', allow_duplicate=True)],
+              Input('ingest-poll', 'n_intervals'),
+              State('ingest-job', 'data'),
+              prevent_initial_call=True)
+def poll_upload(n_intervals, job):
+    if job is None:
+        raise dash.exceptions.PreventUpdate
+
+    filename = job['filename']
+    status = ingest_jobs.status(job['id'])
+
+    if status['state'] == 'error':
+        return dash.no_update, f"Error al cargar el archivo: {status['error']}", None, True
+    if status['state'] != 'done':
+        return dash.no_update, f"Cargando {filename}: {status['progress']:.0%}", dash.no_update, dash.no_update
+
+    # Los datos nuevos ya están en su partición; se añaden al cubo de este worker
+    return line_chart_figure(yearly_sales()), ingest_summary(filename, status['result']), None, True
+
+# Resumen de una carga: filas nuevas y duplicadas, o si el archivo ya estaba
+def ingest_summary(filename, result):
+    if result['already_loaded']:
+        return f'{filename} ya estaba cargado; no se añadió ninguna fila'
+    return f"{filename}: {result['new']} filas nuevas, {result['duplicates']} duplicadas"
+
+# Crea el gráfico de línea con las ventas globales por año
+def line_chart_figure(df_grouped):
     fig = {
         'data': [
             {'x': df_grouped['Year'], 'y': df_grouped['Global_Sales'], 'type': 'line', 'name': 'Global Sales'},
@@ -187,49 +376,42 @@ def update_graph(contents, filename):
 
     return fig
 
-# Función para cargar el archivo CSV y procesar los datos
-def parse_contents(contents, filename):
-    global global_data
-
-    content_type, content_string = contents.split(',')
-
-    # Decodifica el contenido base64 en datos binarios
-    decoded = base64.b64decode(content_string)
-
-    # Lee los datos del CSV
-    new_data = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-
-    # Guarda los nuevos datos en el archivo CSV
-    current_data = pd.read_csv(csv_filename)
-    updated_data = pd.concat([current_data, new_data], ignore_index=True)
-    updated_data.to_csv(csv_filename, index=False)
-
-    # Actualiza la variable global con los datos combinados
-    global_data = updated_data
+# Suma las ventas globales por año a partir del cubo de este worker
+def yearly_sales():
+    sales_cube = get_sales_cube()
 
     # Agrupa por año y suma las ventas globales
-    df_grouped = global_data.groupby('Year')['Global_Sales'].sum().reset_index()
+    df_grouped = aggregation.groupby_sum(sales_cube, 'Year', 'Global_Sales').reset_index()
 
     return df_grouped
 
 # Callback para actualizar el gráfico de barras
 @app.callback(Output('bar-chart', 'figure'),
               [Input('year-slider', 'value'),
-               Input('sales-dropdown', 'value')])
-def update_bar_chart(selected_year, selected_sales):
-    global global_data
-
-    if selected_year is None or global_data is None:
+               Input('sales-dropdown', 'value'),
+               Input('data-version', 'data')])
+def update_bar_chart(selected_year, selected_sales, version):
+    if selected_year is None:
         return dash.no_update
 
-    # Filtra los datos por el año seleccionado
-    df_filtered = global_data[global_data['Year'] == selected_year]
+    fig = bar_chart_figure(selected_year, selected_sales)
+
+    # Si solo se movió el año o llegaron datos nuevos, se envían las barras y
+    # el título; ejes y diseño no cambian
+    if triggered_only('year-slider.value', 'data-version.data'):
+        return figure_patch(fig, ['x', 'y', 'marker.color', 'text'], ['title'])
+    return fig
+
+@memoize(data_version)
+def bar_chart_figure(selected_year, selected_sales):
+    sales_cube = get_sales_cube()
 
-    # Rellena los valores NA con 0
-    df_filtered[selected_sales] = df_filtered[selected_sales].fillna(0)
+    # Filtra las celdas del cubo por el año seleccionado (los NA ya suman 0)
+    with stage('filter', len(sales_cube)):
+        df_filtered = sales_cube[sales_cube['Year'] == selected_year]
 
     # Calcula la suma de las ventas por género
-    df_sum_by_genre = df_filtered.groupby('Genre')[selected_sales].sum().reset_index()
+    df_sum_by_genre = aggregation.groupby_sum(df_filtered, 'Genre', selected_sales).reset_index()
 
     # Redondea los valores a 2 dígitos decimales
     df_sum_by_genre[selected_sales] = df_sum_by_genre[selected_sales].round(2)
@@ -268,35 +450,29 @@ def update_bar_chart(selected_year, selected_sales):
 # Callback para actualizar el gráfico de series temporales
 @app.callback(Output('time-series-chart', 'figure'),
               [Input('year-slider-ts', 'value'),
-               Input('genre-checklist-ts', 'value')])
-def update_time_series_chart(selected_year, selected_genres):
-    global global_data
-
-    if selected_year is None or global_data is None:
+               Input('genre-checklist-ts', 'value'),
+               Input('data-version', 'data')])
+def update_time_series_chart(selected_year, selected_genres, version):
+    if selected_year is None:
         return dash.no_update
 
-    # Filtra los datos por el año seleccionado y géneros seleccionados
-    df_filtered = global_data[(global_data['Year'] <= selected_year) & (global_data['Genre'].isin(selected_genres))]
+    fig = time_series_figure(selected_year, selected_genres)
 
-    # Agrupa los datos por año y género, y calcula la suma de las ventas
-    df_sum_by_year = df_filtered.groupby(['Year', 'Genre'])['Global_Sales'].sum().reset_index()
+    # Con datos nuevos las series cambian, pero no los géneros elegidos ni el diseño
+    if triggered_only('data-version.data'):
+        return figure_patch(fig, ['x', 'y', 'text'])
+    return fig
 
-    # Redondea los valores a 2 dígitos decimales
-    df_sum_by_year['Global_Sales'] = df_sum_by_year['Global_Sales'].round(2)
+@memoize(data_version)
+def time_series_figure(selected_year, selected_genres):
+    genre_index = get_genre_index()
+
+    # Corta las series ya agrupadas y redondeadas de cada género hasta el año seleccionado
+    series = {genre: genre_series_until(genre_index, genre, selected_year) for genre in selected_genres}
 
     # Crea el gráfico de series temporales
     fig = {
-        'data': [
-            {
-                'x': df_sum_by_year[df_sum_by_year['Genre'] == genre]['Year'],
-                'y': df_sum_by_year[df_sum_by_year['Genre'] == genre]['Global_Sales'],
-                'type': 'line',
-                'mode': 'lines+markers',
-                'name': genre,
-                'text': df_sum_by_year[df_sum_by_year['Genre'] == genre]['Global_Sales'].astype(str),
-                'hoverinfo': 'x+text',
-            } for genre in selected_genres
-        ],
+        'data': line_traces(series, selected_genres),
         'layout': {
             'title': 'Ventas de Géneros a lo largo del tiempo',
             'xaxis': {'title': 'Año'},
@@ -307,6 +483,25 @@ def update_time_series_chart(selected_year, selected_genres):
 
     return fig
 
+# La llama gunicorn.conf.py en el proceso maestro cuando la aplicación se
+# precarga: los workers comparten así las librerías y los datos ya cargados
+def warm_up():
+    preload(pd, go)
+    refresh_data()
+
+    # Las opciones de las pestañas; con QUERY_BACKEND=memory cargan las filas
+    distinct_values(video_games.name, 'Platform')
+    distinct_values(video_games.name, 'Genre')
+
+# Empieza a vigilar PRUEBA_WATCH_DIR en este proceso, una sola vez. La llaman
+# gunicorn.conf.py al arrancar cada worker y la primera petición que recibe;
+# no se llama en el proceso maestro, que no debe crear hilos antes del fork.
+def start_watching():
+    if watcher is not None:
+        watcher.start()
+
+server.before_request(start_watching)
+
 if __name__ == '__main__':
-    app.run_server(debug=True, port=8051)
+    app.run(debug=True, port=8051)
 
@@ -0,0 +1,94 @@
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Row positions of every value of a frame's categorical columns, so an
+# equality filter costs the rows it matches instead of a scan of the whole
+# column. Positions are kept as sorted int32 arrays (frames of fewer than
+# 2**31 rows); a filter on several columns intersects them.
+
+
+# Positions of a sorted array `small` also found in the sorted array `large`,
+# both positions in a frame of `rows` rows. A short `small` is binary
+# searched in `large`; otherwise `large` is marked in a bitmap of the frame,
+# which costs about len(large) cheap writes and beats the cache misses of
+# a binary search once small is more than 1/16th of large.
+def _intersect(small, large, rows):
+    if not len(small) or not len(large):
+        return small[:0]
+
+    if len(small) * 16 > len(large):
+        bitmap = np.zeros(rows, dtype=bool)
+        bitmap[large] = True
+        return small[bitmap[small]]
+
+    found = np.minimum(np.searchsorted(large, small), len(large) - 1)
+    return small[large[found] == small]
+
+
+# Index of the listed columns of a frame. An index is never changed once
+# built: extended() returns a new one, so a thread still filtering the
+# frame it was loaded with keeps positions that fit it.
+class CategoryIndex:
+    def __init__(self, columns, positions=None, rows=0):
+        self.columns = list(columns)
+        self.rows = rows
+        self._positions = positions or {column: {} for column in self.columns}
+
+    @classmethod
+    def build(cls, frame, columns):
+        return cls(columns).extended(frame)
+
+    # Index of the rows indexed so far followed by the rows of frame, as
+    # when frame is appended to the indexed one; only frame is read
+    def extended(self, frame):
+        positions = {}
+        for column in self.columns:
+            values = frame[column]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+
+            # Rows grouped by category code, each group in row order; missing
+            # values (code -1) sort first and are left out
+            codes = values.cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable').astype(np.int32)
+            bounds = np.searchsorted(codes[order], np.arange(len(values.cat.categories) + 1))
+
+            positions[column] = dict(self._positions[column])
+            for code, value in enumerate(values.cat.categories):
+                start, stop = bounds[code], bounds[code + 1]
+                if start == stop:
+                    continue
+                rows = order[start:stop] + np.int32(self.rows)
+                previous = positions[column].get(value)
+                positions[column][value] = rows if previous is None else np.concatenate([previous, rows])
+
+        return CategoryIndex(self.columns, positions, self.rows + len(frame))
+
+    # Whether every column of a filter is indexed
+    def covers(self, where):
+        return all(column in self._positions for column in where)
+
+    # Sorted distinct values present in an indexed column
+    def values(self, column):
+        return sorted(self._positions[column])
+
+    # Sorted positions of the rows matching `where`, a {column: value or
+    # list of values} mapping of indexed columns
+    def lookup(self, where):
+        matches = []
+        for column, value in where.items():
+            positions = self._positions[column]
+            if isinstance(value, (list, tuple, set)):
+                found = [positions[item] for item in value if item in positions]
+                matches.append(np.sort(np.concatenate(found)) if found else np.empty(0, np.int32))
+            else:
+                matches.append(positions.get(value, np.empty(0, np.int32)))
+
+        # The shortest list bounds the result; the others only check its rows
+        matches.sort(key=len)
+        result = matches[0]
+        for other in matches[1:]:
+            result = _intersect(result, other, self.rows)
+        return result
@@ -0,0 +1,123 @@
+from instrumentation import stage
+from lazy import lazy_import
+from schemas import enforce_schema
+
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow')
+pc = lazy_import('pyarrow.compute')
+ds = lazy_import('pyarrow.dataset')
+acero = lazy_import('pyarrow.acero')
+
+# Queries answered straight from the Feather files of a dataset version, for
+# data larger than a worker's memory. Files are scanned as one Arrow dataset
+# a batch at a time: only the columns a query names are read, filters are
+# applied to each batch as it is read, and aggregates keep one row per group.
+# Results have the types and shape the in-memory path (datasets.select and
+# pandas groupby) gives.
+
+# Hash aggregate function of every aggregation query() accepts
+HASH_AGGREGATES = {'sum': 'hash_sum', 'mean': 'hash_mean', 'min': 'hash_min', 'max': 'hash_max',
+                   'count': 'hash_count', 'size': 'hash_count_all'}
+
+
+# Arrow type of a schemas.py column type. Categories are read as plain
+# strings, so files written with different dictionaries form one dataset.
+def _arrow_type(dtype):
+    if dtype == 'category':
+        return pa.string()
+    if dtype == 'datetime64[ns]':
+        return pa.timestamp('ns')
+    dtype = pd.api.types.pandas_dtype(dtype)
+    return pa.from_numpy_dtype(getattr(dtype, 'numpy_dtype', dtype))
+
+
+# Files of one dataset version as an Arrow dataset in the given schema;
+# columns missing from older files read as nulls
+def open_files(paths, schema):
+    arrow_schema = pa.schema([(name, _arrow_type(dtype)) for name, dtype in schema.items()])
+    return ds.dataset(paths, schema=arrow_schema, format='feather')
+
+
+# Arrow filter of a {column: value or list of values} mapping, None for no filter
+def where_expression(where):
+    expression = None
+    for column, value in where.items():
+        if isinstance(value, (list, tuple, set)):
+            condition = ds.field(column).isin(list(value))
+        else:
+            condition = ds.field(column) == value
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+# Scan, filter and aggregate as one streaming Acero plan
+def _plan(dataset, columns, where, aggregate):
+    expression = where_expression(where)
+    nodes = [acero.Declaration('scan', acero.ScanNodeOptions(dataset, columns=columns, filter=expression))]
+    if expression is not None:
+        nodes.append(acero.Declaration('filter', acero.FilterNodeOptions(expression)))
+    nodes.append(acero.Declaration('project', acero.ProjectNodeOptions([ds.field(name) for name in columns], columns)))
+    nodes.append(acero.Declaration('aggregate', aggregate))
+    return acero.Declaration.from_sequence(nodes)
+
+
+# Arrow table to a frame in the dataset schema; strings become categories,
+# sorted as in stored frames, without going through Python objects
+def _to_frame(table, schema):
+    for number, field in enumerate(table.schema):
+        if schema.get(field.name) == 'category':
+            table = table.set_column(number, field.name, table.column(number).dictionary_encode())
+    frame = table.to_pandas()
+
+    typed = enforce_schema(frame, {name: schema[name] for name in frame.columns if name in schema})
+    for name, dtype in typed.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            typed[name] = typed[name].cat.reorder_categories(sorted(dtype.categories))
+    return frame.assign(**dict(typed.items()))
+
+
+# Rows of the files matching `where`, with the given columns (all by
+# default), in the order they are stored
+def scan_rows(paths, schema, where, columns=None):
+    columns = list(schema) if columns is None else list(columns)
+    table = open_files(paths, schema).to_table(columns=columns, filter=where_expression(where))
+
+    with stage('filter', table.num_rows):
+        return _to_frame(table, schema)
+
+
+# frame.groupby(by, observed=True)[values].agg(agg) over the rows of the
+# files matching `where`, without loading them; agg 'size' counts rows
+def scan_aggregate(paths, schema, where, by, values, agg):
+    keys = [by] if isinstance(by, str) else list(by)
+    targets = [] if agg == 'size' else ([values] if isinstance(values, str) else list(values))
+    function = HASH_AGGREGATES[agg]
+
+    # Sums of groups without values are 0, as in pandas
+    options = pc.ScalarAggregateOptions(min_count=0) if agg == 'sum' else None
+    aggregates = [([], function, None, 'size')] if agg == 'size' else \
+        [(target, function, options, target) for target in targets]
+
+    columns = list(dict.fromkeys(keys + targets))
+    plan = _plan(open_files(paths, schema), columns, where, acero.AggregateNodeOptions(aggregates, keys=keys))
+
+    with stage('groupby'):
+        table = plan.to_table()
+
+    # Groups ordered and typed as pandas orders and types them; missing keys
+    # are not a group
+    frame = _to_frame(table, schema).dropna(subset=keys).sort_values(keys).set_index(by if isinstance(by, str) else keys)
+    empty = enforce_schema(pd.DataFrame(), {name: schema[name] for name in columns})
+    if agg == 'size':
+        expected = empty.groupby(by, observed=True).size()
+        return frame['size'].astype(expected.dtype).rename(expected.name)
+
+    expected = empty.groupby(by, observed=True)[values].agg(agg)
+    return frame[values].astype(expected.dtypes if isinstance(values, list) else expected.dtype)
+
+
+# Sorted distinct values of a column of the files, nulls left out
+def scan_distinct(paths, schema, column):
+    plan = _plan(open_files(paths, schema), [column], {}, acero.AggregateNodeOptions([], keys=[column]))
+    values = plan.to_table().column(0).drop_null().to_pylist()
+    return sorted(values)
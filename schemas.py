@@ -0,0 +1,70 @@
+from lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Declared columns of the datasets the dashboards load, with the types they
+# are stored in: categoricals for low-cardinality text and the narrowest
+# numeric type that fits everything else.
+
+# Supermarket sales (demo.py)
+SUPERMARKET_SALES = {
+    'Date': 'datetime64[ns]',
+    'City': 'category',
+    'Product line': 'category',
+    'gross income': 'float32',
+    'Latitude': 'float32',
+    'Longitude': 'float32',
+    'Gender': 'category',
+    'Payment': 'category',
+    'gross margin': 'float32',
+}
+
+# Video-game sales (prueba_emiliano.py); Year may be missing, hence nullable
+VIDEO_GAME_SALES = {
+    'Name': 'category',
+    'Year': 'Int16',
+    'Genre': 'category',
+    'Platform': 'category',
+    'Global_Sales': 'float32',
+    'NA_Sales': 'float32',
+    'EU_Sales': 'float32',
+    'JP_Sales': 'float32',
+    'Other_Sales': 'float32',
+}
+
+# Columns identifying one video-game row; a row with a stored key is a duplicate
+VIDEO_GAME_KEY = ['Name', 'Platform', 'Year']
+
+
+# Cast a frame to a schema, adding missing columns as nulls and dropping
+# the ones the schema does not declare. Columns already of the right type
+# are not copied.
+def enforce_schema(frame, schema):
+    columns = {}
+
+    for name, dtype in schema.items():
+        if name not in frame.columns:
+            columns[name] = pd.Series(None, index=frame.index, dtype=dtype)
+        elif dtype == 'category' and isinstance(frame[name].dtype, pd.CategoricalDtype):
+            columns[name] = frame[name]
+        elif dtype == 'category':
+            values = frame[name].astype('category')
+            columns[name] = values.cat.reorder_categories(sorted(values.cat.categories))
+        elif frame[name].dtype == dtype:
+            columns[name] = frame[name]
+        else:
+            columns[name] = frame[name].astype(dtype)
+
+    return pd.DataFrame(columns, copy=False)
+
+
+# Sorted distinct values of a column, for dropdown and checklist options
+def category_values(frame, column):
+    if frame is None or column not in frame.columns:
+        return []
+
+    values = frame[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return list(values.cat.categories)
+
+    return sorted(values.dropna().unique())
@@ -0,0 +1,83 @@
+import math
+
+from engine import get_engine
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Size of a grid cell on screen: points closer than this become one marker
+CELL_PIXELS = 24
+
+# Zoom of a map drawn before the user has moved it
+DEFAULT_ZOOM = 5
+
+# Window coordinates are rounded outwards to this many cells, so small pans
+# inside the same block reuse the memoized result
+SNAP_CELLS = 16
+
+
+# Degrees covered by one cell at a mapbox zoom level (512-pixel tiles)
+def cell_degrees(zoom):
+    return 360 / 2 ** zoom / 512 * CELL_PIXELS
+
+
+# Center of (west, south, east, north) bounds
+def bounds_center(bounds):
+    west, south, east, north = bounds
+    return {'lat': (south + north) / 2, 'lon': (west + east) / 2}
+
+
+# (zoom level, window) the user moved a map to, read from its relayoutData;
+# None when the event did not move the map. The window is the visible area
+# with a quarter screen of margin, rounded outwards to whole blocks of cells.
+def map_view(relayout_data):
+    if not relayout_data or 'mapbox.zoom' not in relayout_data:
+        return None
+
+    zoom = int(relayout_data['mapbox.zoom'])
+    corners = (relayout_data.get('mapbox._derived') or {}).get('coordinates')
+    if not corners:
+        return zoom, None
+
+    lons = [corner[0] for corner in corners]
+    lats = [corner[1] for corner in corners]
+    margin_lon = (max(lons) - min(lons)) / 4
+    margin_lat = (max(lats) - min(lats)) / 4
+
+    block = cell_degrees(zoom) * SNAP_CELLS
+    window = (
+        math.floor((min(lons) - margin_lon) / block) * block,
+        math.floor((min(lats) - margin_lat) / block) * block,
+        math.ceil((max(lons) + margin_lon) / block) * block,
+        math.ceil((max(lats) + margin_lat) / block) * block,
+    )
+
+    return zoom, window
+
+
+# Points binned into square grid cells of CELL_PIXELS at a zoom level: one
+# row per (cell, key) with the mean position of its points and the sum of
+# value. Only points inside window (west, south, east, north) are kept, so
+# the number of rows depends on the screen, not on the number of points.
+def bin_points(frame, lat, lon, keys, value, zoom, window=None):
+    if window is not None:
+        west, south, east, north = window
+        inside = frame[lon].between(west, east) & frame[lat].between(south, north)
+        frame = frame[inside]
+
+    cell = cell_degrees(zoom)
+    binned = frame[keys].assign(**{
+        'cell_lat': np.floor(frame[lat].to_numpy(dtype=float) / cell),
+        'cell_lon': np.floor(frame[lon].to_numpy(dtype=float) / cell),
+        lat: frame[lat].to_numpy(dtype=float),
+        lon: frame[lon].to_numpy(dtype=float),
+        value: frame[value].to_numpy(dtype=float),
+        'points': 1,
+    })
+
+    sums = get_engine().groupby_sum(binned, ['cell_lat', 'cell_lon'] + keys, [lat, lon, value, 'points'])
+    # Positions to about a meter, which is all a marker can show
+    sums[lat] = (sums[lat] / sums['points']).round(5)
+    sums[lon] = (sums[lon] / sums['points']).round(5)
+
+    return sums.reset_index()[[lat, lon] + keys + [value]]
@@ -0,0 +1,181 @@
+# Local ingest mode: CSV files dropped into a directory (e.g. by a nightly
+# ETL) are ingested into a registered dataset as they appear, without anyone
+# uploading them in the browser. Run it next to the server:
+#
+#   python watcher.py video_game_sales /srv/etl/ventas
+#
+# or let prueba_emiliano.py watch PRUEBA_WATCH_DIR from its own workers. Either
+# way one process at a time watches a directory, however many are started.
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from datasets import get_dataset, ingest_file
+from datastore import STORE_DIR, atomic_write
+from jobs import JobQueue
+
+# Directory of the lock and the list of files ingested so far, per watch
+WATCH_STATE_DIR = os.environ.get('WATCH_STATE_DIR', os.path.join(STORE_DIR, 'watch'))
+
+# Seconds between two scans of a watched directory
+WATCH_INTERVAL = float(os.environ.get('WATCH_INTERVAL', 10))
+
+# Seconds between two checks of a running ingest job
+JOB_POLL_INTERVAL = 0.5
+
+_log = logging.getLogger('ingest.watch')
+
+
+# Content hash of a file, read a block at a time. Not equal to the hash of
+# the same file uploaded in the browser (see ingest.upload_digest), which
+# hashes its base64 text; its rows are still not stored twice.
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Name under which ingest_file can take (and remove) the file, leaving the
+# watched one in place: a hard link when both are on the same file system
+def _staged_copy(path):
+    fd, staged = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    os.remove(staged)
+    try:
+        os.link(path, staged)
+    except OSError:
+        shutil.copyfile(path, staged)
+    return staged
+
+
+# Watches `directory` for CSV files and ingests each into the dataset named
+# `name` through `jobs`, one file at a time in name order. A file is taken
+# once it has kept its size and modification time for a whole interval, so
+# a file still being written is left for a later scan.
+#
+# The watching process holds an exclusive lock on a file under
+# WATCH_STATE_DIR; other processes retry every interval and take over when
+# it exits. Files already ingested are listed next to the lock by size and
+# modification time, so they are not hashed again after a restart.
+class DirectoryWatcher:
+    def __init__(self, name, directory, jobs, interval=WATCH_INTERVAL, state_dir=WATCH_STATE_DIR):
+        self.name = name
+        self.directory = os.path.abspath(directory)
+        self.jobs = jobs
+        self.interval = interval
+
+        key = hashlib.sha1(f'{name}:{self.directory}'.encode()).hexdigest()[:16]
+        self.lock_path = os.path.join(state_dir, f'{key}.lock')
+        self.ingested_path = os.path.join(state_dir, f'{key}.json')
+
+        self._pending = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        os.makedirs(state_dir, exist_ok=True)
+
+    # Watch in a daemon thread of this process; calling it again does nothing
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name=f'watch-{self.name}', daemon=True)
+                self._thread.start()
+
+    # Watch in the calling thread, forever
+    def run(self):
+        with open(self.lock_path, 'a') as lock:
+            while not self._try_lock(lock):
+                time.sleep(self.interval)
+
+            _log.info('watching %s for %s', self.directory, self.name)
+            while True:
+                try:
+                    self.scan()
+                except Exception:
+                    _log.exception('scan of %s failed', self.directory)
+                time.sleep(self.interval)
+
+    @staticmethod
+    def _try_lock(handle):
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    # One pass over the directory: ingest the files that settled since the
+    # last pass. Returns the results of the jobs run.
+    def scan(self):
+        ingested = self._read_ingested()
+        settled = []
+        pending = {}
+
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name):
+            if entry.name.startswith('.') or not entry.name.lower().endswith('.csv') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            signature = [stat.st_size, stat.st_mtime_ns]
+            if ingested.get(entry.name, {}).get('signature') == signature:
+                continue
+            if self._pending.get(entry.name) == signature:
+                settled.append((entry.path, signature))
+            else:
+                pending[entry.name] = signature
+        self._pending = pending
+
+        results = []
+        for path, signature in settled:
+            result = self._ingest(path)
+            ingested[os.path.basename(path)] = {'signature': signature, 'digest': result['digest'],
+                                                'error': result.get('error')}
+            self._write_ingested(ingested)
+            results.append(result)
+        return results
+
+    def _ingest(self, path):
+        digest = file_digest(path)
+        dataset = get_dataset(self.name)
+        if dataset.contains(digest):
+            return {'file': path, 'digest': digest, 'already_loaded': True}
+
+        job_id = self.jobs.submit(ingest_file, self.name, _staged_copy(path), digest)
+        status = self.jobs.status(job_id)
+        while status['state'] in ('queued', 'running'):
+            time.sleep(JOB_POLL_INTERVAL)
+            status = self.jobs.status(job_id)
+
+        # A file that failed is listed too, and only tried again once it changes
+        if status['state'] != 'done':
+            _log.error('ingest of %s failed: %s', path, status.get('error'))
+            return {'file': path, 'digest': digest, 'error': status.get('error')}
+
+        _log.info('ingested %s: %s', path, status['result'])
+        result = status['result']
+        return {'file': path, 'digest': digest, **(result if isinstance(result, dict) else {})}
+
+    def _read_ingested(self):
+        try:
+            with open(self.ingested_path) as handle:
+                return json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_ingested(self, ingested):
+        with atomic_write(self.ingested_path) as handle:
+            json.dump(ingested, handle)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if len(sys.argv) != 3:
+        sys.exit('usage: python watcher.py DATASET DIRECTORY')
+    DirectoryWatcher(sys.argv[1], sys.argv[2], JobQueue()).run()
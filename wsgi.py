@@ -0,0 +1,49 @@
+# Both dashboards as pages of one server, sharing its workers, its data
+# layer (datasets.py) and its result cache:
+#
+#   gunicorn wsgi:server
+#
+# demo.py is served under /demo/ and prueba_emiliano.py under /ventas/; the
+# root page links to both. Each app still runs on its own with
+# `gunicorn demo:server` or `gunicorn prueba_emiliano:server`.
+import os
+
+import flask
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+# Read by the apps when they are created, so set before importing them
+os.environ.setdefault('DEMO_URL_PREFIX', '/demo/')
+os.environ.setdefault('PRUEBA_URL_PREFIX', '/ventas/')
+
+import demo
+import prueba_emiliano
+
+PAGES = [
+    (os.environ['DEMO_URL_PREFIX'], 'Supermarket sales', demo),
+    (os.environ['PRUEBA_URL_PREFIX'], 'Ventas de videojuegos', prueba_emiliano),
+]
+
+index = flask.Flask(__name__)
+
+
+@index.route('/')
+def pages():
+    links = ''.join(f'<li><a href="{prefix}">{title}</a></li>' for prefix, title, _ in PAGES)
+    return f'<!DOCTYPE html><html><head><title>Dashboards</title></head><body><ul>{links}</ul></body></html>'
+
+
+server = DispatcherMiddleware(index, {prefix.rstrip('/'): module.server for prefix, _, module in PAGES})
+
+
+# Called by gunicorn.conf.py in the master process when the app is preloaded
+def warm_up():
+    for _, _, module in PAGES:
+        module.warm_up()
+
+
+# Called by gunicorn.conf.py in every worker once it is started
+def start_watching():
+    for _, _, module in PAGES:
+        start = getattr(module, 'start_watching', None)
+        if start is not None:
+            start()